@@ -0,0 +1,144 @@
+import datetime
+import threading
+import time
+
+import numpy as np
+
+SORT_KEYS = ['value', 'return', 'day', 'drawdown']
+
+
+class Analytics:
+    # Values every account in one pass. All open positions are held as arrays
+    # (owner index, symbol index, side, amount, avg_price), rebuilt only when some
+    # account has traded since the last refresh; each refresh prices every distinct
+    # symbol with one bulk fetch and computes, per account, total value, return on
+    # initial_balance, change since the previous day's last mark and drawdown from
+    # the highest mark, plus site-wide exposure per asset.
+    #
+    # Each refresh also records the account values as today's marks, so daily
+    # change and drawdown are measured against values this engine has seen.
+    def __init__(self, storage, get_prices, max_age):
+        self.storage = storage
+        self.get_prices = get_prices
+        self.max_age = max_age
+        self._version = None
+        self._marks_day = None
+        self._result = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        # The cached result, recomputed first when older than max_age
+        result = self._result
+        if result is None or time.time() - result['computed_at'] >= self.max_age:
+            result = self.refresh()
+        return result
+
+    def refresh(self):
+        with self._lock:
+            version = self.storage.ledger_version()
+            if version != self._version:
+                self._load_accounts()
+                self._version = version
+            today = datetime.date.today().isoformat()
+            if today != self._marks_day:
+                self._load_marks(today)
+            prices = self.get_prices(self.symbols)
+            self._result = self._compute(np.array([prices.get(s, 0.0) for s in self.symbols], dtype=np.float64))
+            self.storage.put_marks(today, dict(zip(self.usernames, self._result['value'].tolist())))
+            return self._result
+
+    def _load_accounts(self):
+        accounts = self.storage.accounts()
+        known = self.usernames if self._marks_day is not None else None
+        self.usernames = [row[0] for row in accounts]
+        index = {username: i for i, username in enumerate(self.usernames)}
+        self.initial = np.array([row[1] for row in accounts], dtype=np.float64)
+        self.balance = np.array([row[2] for row in accounts], dtype=np.float64)
+        rows = [row for row in self.storage.position_rows() if row[0] in index]
+        self.symbols = sorted({row[2] for row in rows})
+        symbol_index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.owner = np.array([index[row[0]] for row in rows], dtype=np.int64)
+        self.symbol = np.array([symbol_index[row[2]] for row in rows], dtype=np.int64)
+        self.long = np.array([row[1] == 'long' for row in rows], dtype=bool)
+        self.amount = np.array([row[3] for row in rows], dtype=np.float64)
+        self.avg_price = np.array([row[4] for row in rows], dtype=np.float64)
+        if known is not None:
+            # Accounts already tracked keep their peak and previous mark; only new
+            # usernames are looked up in equity_marks
+            self._load_marks(self._marks_day, known)
+
+    def _load_marks(self, today, known=()):
+        # Peak and previous-day mark per account. known lists the usernames the
+        # current self.peak and self.previous arrays were built for.
+        carried = {u: (self.peak[i], self.previous[i]) for i, u in enumerate(known)}
+        summary = self.storage.mark_summary(today, [u for u in self.usernames if u not in carried]
+                                            if carried else None)
+        summary.update(carried)
+        self.peak = np.array([summary.get(u, (np.nan, None))[0] for u in self.usernames], dtype=np.float64)
+        self.previous = np.array([summary.get(u, (None, None))[1] for u in self.usernames], dtype=np.float64)
+        self.peak = np.fmax(self.peak, self.initial)
+        self._marks_day = today
+
+    def _compute(self, symbol_prices):
+        n = len(self.usernames)
+        price = symbol_prices[self.symbol] if len(self.symbol) else np.zeros(0)
+        price = np.where(price > 0, price, self.avg_price)  # No quote: value at cost, like the equity engine
+        market = self.amount * price
+        value = np.where(self.long, market, self.amount * (2 * self.avg_price - price))
+        total = self.balance + np.bincount(self.owner, weights=value, minlength=n)
+        self.peak = np.fmax(self.peak, total)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = np.where(self.initial > 0, total / self.initial - 1, 0.0)
+            day = total / self.previous - 1  # NaN until an account has a mark from an earlier day
+            drawdown = total / self.peak - 1
+        m = len(self.symbols)
+        long_exposure = np.bincount(self.symbol[self.long], weights=market[self.long], minlength=m)
+        short_exposure = np.bincount(self.symbol[~self.long], weights=market[~self.long], minlength=m)
+        return {
+            'computed_at': time.time(),
+            'usernames': self.usernames,
+            'value': total,
+            'return': ret,
+            'day': day,
+            'drawdown': drawdown,
+            'symbols': self.symbols,
+            'long_exposure': long_exposure,
+            'short_exposure': short_exposure,
+            'positions': np.bincount(self.symbol, minlength=m),
+        }
+
+
+def _float(value):
+    return None if np.isnan(value) else float(value)
+
+
+def leaderboard(result, sort='value', offset=0, limit=50):
+    # One page of accounts, best first by sort (one of SORT_KEYS), with the total
+    key = result[sort if sort in SORT_KEYS else 'value']
+    order = np.argsort(-np.nan_to_num(key, nan=-np.inf), kind='stable')
+    rows = []
+    for rank, i in enumerate(order[offset:offset + limit], start=offset + 1):
+        rows.append({
+            'rank': rank,
+            'username': result['usernames'][i],
+            'value': float(result['value'][i]),
+            'return': float(result['return'][i]) * 100,
+            'day': _float(result['day'][i] * 100),
+            'drawdown': float(result['drawdown'][i]) * 100,
+        })
+    return rows, len(order)
+
+
+def exposure(result, limit=50):
+    # Assets by gross exposure (long plus short market value) across all accounts
+    gross = result['long_exposure'] + result['short_exposure']
+    rows = []
+    for i in np.argsort(-gross, kind='stable')[:limit]:
+        rows.append({
+            'symbol': result['symbols'][i],
+            'long': float(result['long_exposure'][i]),
+            'short': float(result['short_exposure'][i]),
+            'net': float(result['long_exposure'][i] - result['short_exposure'][i]),
+            'positions': int(result['positions'][i]),
+        })
+    return rows
@@ -1,30 +1,97 @@
-from flask import Flask, render_template, request, redirect, session, jsonify, flash
+from flask import Flask, Response, g, render_template, request, redirect, session, jsonify, flash
+from flask import before_render_template, template_rendered
 from functools import wraps
 import os
 import json
 import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
-import yfinance as yf
-import requests
-from bs4 import BeautifulSoup
 from apscheduler.schedulers.background import BackgroundScheduler
-import logging
-
-logging.getLogger('yfinance').setLevel(logging.CRITICAL)
+from quotes import QuoteCache
+from marketdata import AsyncMarketData
+from barstore import BarStore, from_epoch, to_epoch
+import numpy as np
+import equity
+from stopbook import StopBook
+from storage import Storage
+from catalog import LazyCatalog
+from charts import ChartCache, lttb
+from streaming import PriceHub
+from triggers import TriggerEngine
+from ledger import LedgerCache
+from profiles import ProfileCache
+from analytics import Analytics, SORT_KEYS, exposure, leaderboard
+from trading import OrderError, apply_auto_close, execute, first_trigger, is_triggered, parse_order
+from locks import FileLock, UserLocks
+from metrics import REGISTRY, Counter, Gauge, Histogram
+import cProfile
+import threading
+import time
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'  # Change this to a random secret key
 
-DATA_DIR = 'data/users'
+DATA_DIR = 'data/users'  # Legacy per-user JSON files, migrated into DB_PATH on startup
+DB_PATH = 'data/app.db'
 SERVER_DATA = 'data/server.json'
-os.makedirs(DATA_DIR, exist_ok=True)
+BAR_DIR = 'data/bars'
+LOCK_DIR = 'data/locks'
+SCHEDULER_LOCK = 'data/scheduler.lock'
+MIGRATE_LOCK = 'data/migrate.lock'
 os.makedirs('data', exist_ok=True)
 
+# Instrumentation, exposed at /metrics. Set PROFILE_SLOW_SECONDS to dump cProfile
+# stats for requests slower than that into PROFILE_DIR (one request at a time).
+REQUEST_SECONDS = Histogram('http_request_seconds', 'Request latency', ['endpoint', 'method', 'status'])
+RENDER_SECONDS = Histogram('template_render_seconds', 'Template render time', ['template'])
+STORAGE_SECONDS = Histogram('storage_seconds', 'User storage operations', ['op'])
+LEDGER_SECONDS = Histogram('ledger_seconds', 'Ledger loads and equity replays', ['op'])
+JOB_SECONDS = Histogram('job_seconds', 'Background job duration', ['job'], buckets=(0.01, 0.1, 1, 10, 60, 300))
+SWEEP_POSITIONS = Gauge('sweep_positions_checked', 'Stop-protected positions covered by the last sweep')
+SWEEP_SYMBOLS = Gauge('sweep_symbols_checked', 'Symbols priced by the last sweep')
+AUTO_CLOSES = Counter('auto_closes_total', 'Positions closed by stop orders', ['action'])
+PROFILE_SLOW_SECONDS = float(os.environ.get('PROFILE_SLOW_SECONDS', 0))
+PROFILE_DIR = 'data/profiles'
+profile_lock = threading.Lock()
+
+storage = Storage(DB_PATH)
+with FileLock(MIGRATE_LOCK):  # Workers start together; one imports, the rest find nothing left
+    storage.migrate_json(DATA_DIR)
+user_locks = UserLocks(LOCK_DIR)
+ledgers = LedgerCache(storage.transaction_rows)
+profiles = ProfileCache(storage.load_user, storage.user_version)
+
+QUOTE_TTL = 30  # Seconds a cached quote is served before refetching
+QUOTE_STALE_TTL = 15 * 60  # Pages may show a quote this old, marked as delayed, while it is refetched
+TRADE_QUOTE_MAX_AGE = 5  # Trades fill against quotes no older than this
+UPSTREAM_RATE = 20  # Yahoo requests per second, per worker process
+UPSTREAM_BURST = 40
+market_data = AsyncMarketData(rate=UPSTREAM_RATE, burst=UPSTREAM_BURST)
+quotes = QuoteCache(market_data.fetch_prices, ttl=QUOTE_TTL, shared=storage,  # Shared across worker processes
+                    stale_ttl=QUOTE_STALE_TTL)
+INTRADAY_DAYS = 59  # Yahoo keeps 5m bars for about 60 days
+bars = BarStore(BAR_DIR, market_data.fetch_bars)
+stop_book = StopBook()
+chart_cache = ChartCache()
+STREAM_INTERVAL = 5  # Seconds between price pushes to connected pages
+STREAM_HEARTBEAT = 15
+STREAM_MAX_SYMBOLS = 100
+# Each open stream holds a worker thread; keep this below gunicorn's --threads so
+# other requests still get one. Refused pages poll /api/prices instead.
+STREAM_MAX_CONNECTIONS = int(os.environ.get('STREAM_MAX_CONNECTIONS', 4))
+STREAM_MAX_SECONDS = 300  # Streams end after this long; browsers reconnect, so slots rotate between tabs
+stream_slots = threading.BoundedSemaphore(STREAM_MAX_CONNECTIONS)
+price_hub = PriceHub(lambda symbols: get_prices(symbols, max_age=STREAM_INTERVAL), interval=STREAM_INTERVAL)
+TRIGGER_MIN_INTERVAL = 5  # Poll a symbol this often when its price is near a stop level
+TRIGGER_MAX_INTERVAL = 300  # ... and this often when every stop is far away
+CHART_TTL = {'5m': 60, '1h': 600, '1d': 3600}  # Seconds a chart response is reused, per bar interval
+
 # Fetch available assets
 def get_sp500():
+    import requests
+    from bs4 import BeautifulSoup
     url = "https://www.slickcharts.com/sp500"
     headers = {'User-Agent': 'Mozilla/5.0'}
-    resp = requests.get(url, headers=headers)
+    resp = requests.get(url, headers=headers, timeout=30)
     soup = BeautifulSoup(resp.text, 'html.parser')
     table = soup.find('table', class_='table')
     stocks = []
@@ -62,141 +129,204 @@ def get_commodities():
         {"name": "Lumber", "symbol": "LB=F"},
     ]
 
-assets = {"stocks": get_sp500(), "commodities": get_commodities()}
-all_assets = assets["stocks"] + assets["commodities"]
+def get_all_assets():
+    stocks = get_sp500()
+    if not stocks:
+        raise ValueError("no stocks found on the S&P 500 page")
+    return stocks + get_commodities()
+
+# Loaded on first use from ASSET_SNAPSHOT and refreshed in the background, so
+# startup never waits on (or needs) the network
+ASSET_SNAPSHOT = 'data/assets.json'
+ASSET_MAX_AGE = 24 * 3600
+assets = LazyCatalog(ASSET_SNAPSHOT, get_all_assets, get_commodities, ASSET_MAX_AGE)
+SEARCH_PAGE_SIZE = 50
+HISTORY_PAGE_SIZE = 50  # Transactions per /api/account/transactions page
+EQUITY_CHUNK_DAYS = 90  # Days per /api/account/equity chunk
+MAX_BATCH_ORDERS = 200  # Orders per /api/orders request
+LEADERBOARD_MAX_AGE = 15 * 60  # Seconds; the scheduler sweep refreshes it every 10 minutes
+LEADERBOARD_PAGE_SIZE = 50
+
+analytics = Analytics(storage, lambda symbols: {s: p for s, (p, _) in get_quotes(symbols).items()},
+                      LEADERBOARD_MAX_AGE)
+
+def get_catalog():
+    return assets.get()
 
 def get_asset_name(symbol):
-    for a in all_assets:
-        if a["symbol"] == symbol:
-            return a["name"]
-    return symbol
+    return get_catalog().name(symbol)
 
 # User functions
-def get_user_path(username):
-    return os.path.join(DATA_DIR, f"{username.lower()}.json")
-
+# A user is the compact profile (balances, positions, start_date); transactions are
+# read through get_ledger, and only the ones made since load_user are in
+# user['transactions'] until save_user appends them.
+@STORAGE_SECONDS.timed(op='load_user')
 def load_user(username):
-    path = get_user_path(username)
-    if os.path.exists(path):
-        with open(path, 'r') as f:
-            data = json.load(f)
-            if 'start_date' in data and isinstance(data['start_date'], str):
-                data['start_date'] = datetime.datetime.fromisoformat(data['start_date'])
-            if 'portfolio' not in data:
-                data['portfolio'] = {'long': {}, 'short': {}}
-            if 'transactions' not in data:
-                data['transactions'] = []
-            if 'commission_rate' not in data:
-                data['commission_rate'] = 0.00005  # Default for old users
-            return data
-    return None
+    return profiles.get(username.lower())
 
+@STORAGE_SECONDS.timed(op='save_user')
 def save_user(username, data):
-    if 'start_date' in data and isinstance(data['start_date'], datetime.datetime):
-        data['start_date'] = data['start_date'].isoformat()
-    path = get_user_path(username)
-    with open(path, 'w') as f:
-        json.dump(data, f)
+    data['version'] = storage.save_user(username.lower(), data)
+    profiles.put(username.lower(), data)
+
+@STORAGE_SECONDS.timed(op='iter_portfolios')
+def iter_portfolios():
+    return storage.iter_portfolios()
 
 def user_exists(username):
-    return load_user(username) is not None
-
-def get_current_price(symbol):
-    ticker = yf.Ticker(symbol)
-    return ticker.info.get('currentPrice', ticker.info.get('regularMarketPrice', 0.0))
-
-def get_historical_close(symbol, dt):
-    ticker = yf.Ticker(symbol)
-    # Try to get around dt
-    start = dt - datetime.timedelta(hours=12)  # larger window
-    end = dt + datetime.timedelta(minutes=5)
-    hist = ticker.history(start=start, end=end, interval='5m')
-    if not hist.empty:
-        hist = hist[hist.index.tz_convert(None) <= dt]
-        if not hist.empty:
-            return hist['Close'].iloc[-1]
-    # If no intra, fall to daily last before
-    hist = ticker.history(period="1y")
-    hist = hist[hist.index.tz_convert(None) <= dt]
-    if not hist.empty:
-        return hist['Close'].iloc[-1]
-    return get_current_price(symbol)  # if future or no data
-
-def is_triggered(typ, price, pos):
-    stop_loss = pos.get('stop_loss')
-    stop_profit = pos.get('stop_profit')
-    if typ == 'long':
-        if stop_loss is not None and price <= stop_loss:
-            return True, 'stop_loss'
-        if stop_profit is not None and price >= stop_profit:
-            return True, 'stop_profit'
-    elif typ == 'short':
-        if stop_loss is not None and price >= stop_loss:
-            return True, 'stop_loss'
-        if stop_profit is not None and price <= stop_profit:
-            return True, 'stop_profit'
-    return False, None
+    return storage.user_exists(username.lower())
+
+def get_prices(symbols, max_age=None, lane='quotes'):
+    # Symbols without a current quote are left out: they must never be traded or
+    # checked against stops at a price of 0
+    return quotes.get_prices(symbols, max_age=max_age, lane=lane)
+
+def get_quotes(symbols):
+    # {symbol: (price, fresh)} for display; may serve delayed prices, see QuoteCache
+    return quotes.get_quotes(symbols)
+
+def lookup_closes(symbol, interval, epochs, lookback, result=None):
+    # Last close at or before each of the sorted epochs, NaN where none within lookback
+    if result is None:
+        result = np.full(len(epochs), np.nan)
+    lookback = int(lookback.total_seconds())
+    times, closes = bars.bars(symbol, interval, from_epoch(epochs[0] - lookback), from_epoch(epochs[-1] + 1))
+    idx = np.searchsorted(times, epochs, side='right') - 1
+    found = idx >= 0
+    found[found] = times[idx[found]] >= epochs[found] - lookback
+    found &= np.isnan(result)
+    result[found] = closes[idx[found]]
+    return result
+
+def get_historical_closes(symbol, epochs):
+    # Close at or before each of the sorted epochs: the 5m bar within 12 hours for
+    # recent times, else the last daily close within a year; NaN where there is none
+    result = None
+    cutoff = to_epoch(datetime.datetime.now() - datetime.timedelta(days=INTRADAY_DAYS))
+    if epochs[-1] > cutoff:
+        result = lookup_closes(symbol, '5m', epochs, datetime.timedelta(hours=12))
+        if not np.isnan(result).any():
+            return result
+    return lookup_closes(symbol, '1d', epochs, datetime.timedelta(days=365), result)
 
 def perform_auto_close(username, typ, symbol, price, action_type, dt=None):
-    user = load_user(username)
-    if dt is None:
-        dt = datetime.datetime.now()
-    pos = user['portfolio'][typ][symbol]
-    amount = pos['amount']
-    commission_rate = user['commission_rate']
-    commission = amount * price * commission_rate
-    if typ == 'long':
-        user['current_balance'] += amount * price - commission
-    else:
-        user['current_balance'] += amount * (2 * pos['avg_price'] - price) - commission
-    del user['portfolio'][typ][symbol]
-    tx = {'datetime': dt.isoformat(), 'action': action_type, 'symbol': symbol, 'amount': amount, 'price': price,
-          'commission': commission, 'stop_loss': pos.get('stop_loss'), 'stop_profit': pos.get('stop_profit')}
-    user['transactions'].append(tx)
-    save_user(username, user)
-
-def check_positions():
-    users = [f[:-5] for f in os.listdir(DATA_DIR) if f.endswith('.json')]
-    for username in users:
+    with user_locks.hold(username):
         user = load_user(username)
-        for typ in ['long', 'short']:
-            for symbol in list(user['portfolio'][typ]):
-                pos = user['portfolio'][typ][symbol]
-                if 'stop_loss' in pos or 'stop_profit' in pos:
-                    price = get_current_price(symbol)
-                    triggered, action_type = is_triggered(typ, price, pos)
-                    if triggered:
-                        perform_auto_close(username, typ, symbol, price, action_type)
+        if dt is None:
+            dt = datetime.datetime.now()
+        pos = user['portfolio'][typ].get(symbol)
+        if pos is not None and is_triggered(typ, price, pos) == (True, action_type):
+            apply_auto_close(user, typ, symbol, price, action_type, dt)
+            save_user(username, user)
+            AUTO_CLOSES.inc(action=action_type)
+        stop_book.sync_user(username, user)
+
+def refresh_stop_book():
+    # Trades in other worker processes change positions behind this process's
+    # back; resync only the users saved since the book's positions version. The
+    # version is read first, so a save racing the load is picked up next time.
+    version = storage.positions_version()
+    if not stop_book.loaded or stop_book.version is None:
+        stop_book.reload(iter_portfolios, version)
+    elif version != stop_book.version:
+        stop_book.update(storage.portfolios_since(stop_book.version), version)
+
+@JOB_SECONDS.timed(job='check_positions')
+def check_positions():
+    refresh_stop_book()
+    prices = get_prices(stop_book.symbols(), lane='stops')
+    SWEEP_POSITIONS.set(stop_book.size())
+    SWEEP_SYMBOLS.set(len(prices))
+    for symbol, price in prices.items():
+        for username, typ, action_type in stop_book.triggered(symbol, price):
+            perform_auto_close(username, typ, symbol, price, action_type)
     # Update last check
     with open(SERVER_DATA, 'w') as f:
         json.dump({'last_check': datetime.datetime.now().isoformat()}, f)
+    with JOB_SECONDS.time(job='analytics'):
+        analytics.refresh()
 
+@JOB_SECONDS.timed(job='catch_up')
 def catch_up():
-    if os.path.exists(SERVER_DATA):
-        with open(SERVER_DATA, 'r') as f:
-            data = json.load(f)
-            last_check_str = data.get('last_check')
-            if last_check_str:
-                last_check = datetime.datetime.fromisoformat(last_check_str)
-                now = datetime.datetime.now()
-                times = []
-                ct = last_check + datetime.timedelta(minutes=10)
-                while ct < now:
-                    times.append(ct)
-                    ct += datetime.timedelta(minutes=10)
-                users = [f[:-5] for f in os.listdir(DATA_DIR) if f.endswith('.json')]
-                for t in times:
-                    for username in users:
-                        user = load_user(username)
-                        for typ in ['long', 'short']:
-                            for symbol in list(user['portfolio'][typ]):
-                                pos = user['portfolio'][typ][symbol]
-                                if 'stop_loss' in pos or 'stop_profit' in pos:
-                                    price = get_historical_close(symbol, t)
-                                    if price is not None:
-                                        triggered, action_type = is_triggered(typ, price, pos)
-                                        if triggered:
-                                            perform_auto_close(username, typ, symbol, price, action_type, dt=t)
+    if not os.path.exists(SERVER_DATA):
+        return
+    with open(SERVER_DATA, 'r') as f:
+        last_check_str = json.load(f).get('last_check')
+    if not last_check_str:
+        return
+    last_check = datetime.datetime.fromisoformat(last_check_str)
+    now = datetime.datetime.now()
+    times = []
+    ct = last_check + datetime.timedelta(minutes=10)
+    while ct < now:
+        times.append(ct)
+        ct += datetime.timedelta(minutes=10)
+    if not times:
+        return
+    epochs = np.array([to_epoch(t) for t in times])
+    protected = {}
+    for username, user in iter_portfolios():
+        for typ in ['long', 'short']:
+            for symbol, pos in user['portfolio'][typ].items():
+                if pos.get('stop_loss') is not None or pos.get('stop_profit') is not None:
+                    protected.setdefault(symbol, []).append((username, typ, pos))
+    # One bar request per symbol for the whole gap, then the first crossing per position
+    triggers = {}
+    for symbol, positions in protected.items():
+        prices = get_historical_closes(symbol, epochs)
+        for username, typ, pos in positions:
+            i, action_type = first_trigger(typ, prices, pos)
+            if i is not None:
+                triggers.setdefault(username, []).append((i, typ, symbol, float(prices[i]), action_type))
+    for username, hits in triggers.items():
+        with user_locks.hold(username):
+            user = load_user(username)
+            for i, typ, symbol, price, action_type in sorted(hits):
+                pos = user['portfolio'][typ].get(symbol)
+                if pos is not None and is_triggered(typ, price, pos)[0]:
+                    apply_auto_close(user, typ, symbol, price, action_type, times[i])
+                    AUTO_CLOSES.inc(action=action_type)
+            save_user(username, user)
+        stop_book.sync_user(username, user)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if PROFILE_SLOW_SECONDS and profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def record_request(response):
+    elapsed = time.perf_counter() - g.request_started
+    REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or 'unknown', method=request.method,
+                            status=response.status_code)
+    profiler = stop_profiler()
+    if profiler is not None and elapsed >= PROFILE_SLOW_SECONDS:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{request.endpoint}-{elapsed * 1000:.0f}ms-{os.getpid()}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, name))
+    return response
+
+@app.teardown_request
+def stop_profiler(exc=None):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        profile_lock.release()
+    return profiler
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.setdefault('render_started', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def record_render(sender, template, context, **extra):
+    RENDER_SECONDS.observe(time.perf_counter() - g.render_started.pop(), template=template.name)
+
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
@@ -212,9 +342,6 @@ def create_account():
         if len(password) < 8:
             flash("Password must be at least 8 characters.")
             return render_template('create_account.html')
-        if user_exists(username):
-            flash("Username already exists.")
-            return render_template('create_account.html')
         hash_pw = generate_password_hash(password)
         try:
             initial_balance = float(request.form['initial_balance'])
@@ -237,7 +364,11 @@ def create_account():
             'transactions': [],
             'start_date': datetime.datetime.now()
         }
-        save_user(username, data)
+        with user_locks.hold(username):
+            if user_exists(username):
+                flash("Username already exists.")
+                return render_template('create_account.html')
+            save_user(username, data)
         session['username'] = username
         return redirect('/account')
     return render_template('create_account.html')
@@ -247,8 +378,8 @@ def login():
     if request.method == 'POST':
         username = request.form['username'].lower()
         password = request.form['password']
-        user = load_user(username)
-        if user and check_password_hash(user['password'], password):
+        password_hash = storage.password_hash(username)
+        if password_hash and check_password_hash(password_hash, password):
             session['username'] = username
             return redirect('/account')
         flash("Invalid username or password.")
@@ -267,74 +398,52 @@ def login_required(f):
         return redirect('/account/login')
     return wrap
 
+def user_locked(f):
+    # Serialize a route's load/modify/save of the session user across threads and processes
+    @wraps(f)
+    def wrap(*args, **kwargs):
+        with user_locks.hold(session['username']):
+            return f(*args, **kwargs)
+    return wrap
+
+@LEDGER_SECONDS.timed(op='load')
+def get_ledger(username, user):
+    return ledgers.get(username.lower(), user)
+
+def load_snapshot(username):
+    return storage.load_snapshot(username.lower())
+
+def save_snapshot(username, snapshot):
+    storage.save_snapshot(username.lower(), snapshot)
+
+def get_daily_closes(symbol, days):
+    # Close at midnight of each day, NaN where there is none
+    epochs = np.array([to_epoch(datetime.datetime.combine(day, datetime.time(0, 0))) for day in days])
+    return lookup_closes(symbol, '1d', epochs, datetime.timedelta(days=365))
+
+def get_daily_values(username, end_day, user=None):
+    # Portfolio value at every day from start_date to end_day. Finished days are
+    # persisted, so only the days since the last snapshot are ever computed.
+    if user is None:
+        user = load_user(username)
+    ledger = get_ledger(username, user)
+    snapshot = load_snapshot(username)
+    if snapshot is None or not equity.snapshot_is_valid(snapshot, ledger):
+        snapshot = equity.new_snapshot(user)
+    last_finished = min(end_day, datetime.date.today() - datetime.timedelta(days=1))
+    if last_finished.isoformat() > snapshot['day']:
+        with LEDGER_SECONDS.time(op='advance'):
+            snapshot = equity.advance(snapshot, ledger, last_finished, get_daily_closes)
+        save_snapshot(username, snapshot)
+    with LEDGER_SECONDS.time(op='advance'):
+        snapshot = equity.advance(snapshot, ledger, end_day, get_daily_closes)
+    end_str = end_day.isoformat()
+    return [(day, value) for day, value in zip(snapshot['days'], snapshot['values']) if day <= end_str]
+
 def get_portfolio_value_at_date(username, target_date):
     user = load_user(username)
-    balance = user['initial_balance']
-    commission_rate = user['commission_rate']
-    long = {}
-    short = {}
-    transactions = sorted(user['transactions'], key=lambda x: datetime.datetime.fromisoformat(x['datetime']))
-    for tx in transactions:
-        tx_dt = datetime.datetime.fromisoformat(tx['datetime'])
-        if tx_dt.date() > target_date:
-            break
-        symbol = tx['symbol']
-        am = tx['amount']
-        pr = tx['price']
-        act = tx['action']
-        comm = tx.get('commission', am * pr * commission_rate)
-        if act == 'buy':
-            if symbol in long:
-                old_am = long[symbol]['amount']
-                old_pr = long[symbol]['avg_price']
-                new_am = old_am + am
-                new_pr = (old_am * old_pr + am * pr) / new_am
-                long[symbol]['avg_price'] = new_pr
-                long[symbol]['amount'] = new_am
-            else:
-                long[symbol] = {'amount': am, 'avg_price': pr}
-            balance -= am * pr + comm
-        elif act == 'short':
-            if symbol in short:
-                old_am = short[symbol]['amount']
-                old_pr = short[symbol]['avg_price']
-                new_am = old_am + am
-                new_pr = (old_am * old_pr + am * pr) / new_am
-                short[symbol]['avg_price'] = new_pr
-                short[symbol]['amount'] = new_am
-            else:
-                short[symbol] = {'amount': am, 'avg_price': pr}
-            balance -= am * pr + comm
-        elif act in ['sell_cover', 'stop_loss', 'stop_profit']:
-            revenue = 0
-            if symbol in long:
-                long_am = long.get(symbol, {}).get('amount', 0)
-                revenue = am * pr
-                if am >= long_am:
-                    long.pop(symbol, None)
-                else:
-                    long[symbol]['amount'] -= am
-            elif symbol in short:
-                short_am = short.get(symbol, {}).get('amount', 0)
-                avg = short.get(symbol, {}).get('avg_price', pr) if symbol in short else pr
-                revenue = am * (2 * avg - pr)
-                if am >= short_am:
-                    short.pop(symbol, None)
-                else:
-                    short[symbol]['amount'] -= am
-            balance += revenue - comm
-    value = balance
-    for symbol, pos in long.items():
-        close = get_historical_close(symbol, datetime.datetime.combine(target_date, datetime.time(0,0)))
-        if close is None:
-            close = pos['avg_price']
-        value += pos['amount'] * close
-    for symbol, pos in short.items():
-        close = get_historical_close(symbol, datetime.datetime.combine(target_date, datetime.time(0,0)))
-        if close is None:
-            close = pos['avg_price']
-        value += pos['amount'] * (2 * pos['avg_price'] - close)
-    return value
+    values = get_daily_values(username, target_date, user=user)
+    return values[-1][1] if values else user['initial_balance']
 
 @app.route('/account')
 @login_required
@@ -344,10 +453,10 @@ def account():
     asset_values = []
     total_assets = 0.0
     current_balance = user['current_balance']
+    latest = get_quotes({symbol for typ in ['long', 'short'] for symbol in user['portfolio'].get(typ, {})})
     for typ in ['long', 'short']:
         for symbol, pos in user['portfolio'].get(typ, {}).items():
-            ticker = yf.Ticker(symbol)
-            price = ticker.info.get('currentPrice', ticker.info.get('regularMarketPrice', 0.0))
+            price, fresh = latest.get(symbol, (pos['avg_price'], False))  # No quote at all: value at cost
             if typ == 'long':
                 value = pos['amount'] * price
                 percent = ((price - pos['avg_price']) / pos['avg_price'] * 100) if pos['avg_price'] > 0 else 0.0
@@ -358,7 +467,9 @@ def account():
                 'symbol': symbol,
                 'name': get_asset_name(symbol),
                 'amount': pos['amount'],
+                'avg_price': pos['avg_price'],
                 'price': price,
+                'fresh': fresh,
                 'value': value,
                 'action': 'Long' if typ == 'long' else 'Short',
                 'percent_change': percent
@@ -369,206 +480,321 @@ def account():
     percent_change = ((total_value / initial_value) - 1) * 100 if initial_value > 0 else 0.0
     today = datetime.date.today()
     yesterday = today - datetime.timedelta(days=1)
-    value_yesterday = get_portfolio_value_at_date(username, yesterday)
+    values = get_daily_values(username, yesterday, user=user)
+    value_yesterday = values[-1][1] if values else initial_value
     day_percent_change = ((total_value / value_yesterday) - 1) * 100 if value_yesterday > 0 else 0.0
-    return render_template('account.html', balance=current_balance, asset_values=asset_values, total_value=total_value, percent_change=percent_change, day_percent_change=day_percent_change)
+    return render_template('account.html', balance=current_balance, asset_values=asset_values, total_value=total_value, percent_change=percent_change, day_percent_change=day_percent_change, initial_value=initial_value, value_yesterday=value_yesterday, stream_interval=STREAM_INTERVAL)
 
 @app.route('/account/history')
 @login_required
 def history():
+    # Only the page shell: the equity table, chart and transactions are fetched
+    # in chunks by the page, so the response does not grow with account age
+    return render_template('history.html', page_size=HISTORY_PAGE_SIZE, chunk_days=EQUITY_CHUNK_DAYS)
+
+@app.route('/api/account/transactions')
+@login_required
+def api_transactions():
+    # Newest first. Pass the returned 'next' back as ?before= for older rows.
+    username = session['username']
+    before = request.args.get('before')
+    if before is not None:
+        try:
+            t, tx_id = before.split('_')
+            before = (int(t), int(tx_id))
+        except ValueError:
+            return jsonify({'error': 'invalid cursor'}), 400
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), 500)
+    transactions, cursor = get_ledger(username, load_user(username)).page(before, limit)
+    return jsonify({'transactions': transactions, 'next': None if cursor is None else f"{cursor[0]}_{cursor[1]}"})
+
+@app.route('/api/account/equity')
+@login_required
+def api_equity():
+    # Daily value and 1-day % change for the `days` days ending at `end` (default
+    # today, oldest first). 'next' is the end of the preceding chunk, None at
+    # start_date. days=0 returns everything; ?max_points=N downsamples with LTTB.
     username = session['username']
-    user = load_user(username)
-    start_date = user['start_date'].date()
     today = datetime.date.today()
-    days = []
-    previous_value = user['initial_balance']
-    for n in range(0, (today - start_date).days + 1):
-        day = start_date + datetime.timedelta(days=n)
-        value = get_portfolio_value_at_date(username, day)
-        change = ((value / previous_value) - 1) * 100 if previous_value > 0 else 0.0
-        days.append({'day': day.strftime('%Y-%m-%d'), 'value': value, 'change': change})
-        previous_value = value
-    days_table = days[::-1]
-    days_chart = [d['day'] for d in days]
-    values_chart = [d['value'] for d in days]
-    transactions = sorted(user['transactions'], key=lambda x: x['datetime'], reverse=True)
-    return render_template('history.html', days=days_table, days_chart=days_chart, values_chart=values_chart, transactions=transactions)
+    try:
+        end = min(datetime.date.fromisoformat(request.args.get('end', today.isoformat())), today)
+    except ValueError:
+        return jsonify({'error': 'invalid end date'}), 400
+    span = max(request.args.get('days', EQUITY_CHUNK_DAYS, type=int), 0)
+    max_points = request.args.get('max_points', 0, type=int)
+    user = load_user(username)
+    series = get_daily_values(username, end, user=user)
+    first = max(len(series) - span, 0) if span else 0
+    previous = series[first - 1][1] if first else user['initial_balance']
+    days = [day for day, _ in series[first:]]
+    values = np.array([value for _, value in series[first:]])
+    base = np.concatenate([[previous], values])[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        changes = np.where(base > 0, (values / base - 1) * 100, 0.0)
+    if max_points:
+        keep, _ = lttb(np.arange(len(values)), values, max_points)
+        days = [days[i] for i in keep]
+        values, changes = values[keep], changes[keep]
+    return jsonify({'days': days, 'values': values.tolist(), 'changes': changes.tolist(),
+                    'next': series[first - 1][0] if first else None})
 
 @app.route('/stats/<symbol>')
 @login_required
 def stats(symbol):
-    if not any(a['symbol'] == symbol for a in all_assets):
+    if symbol not in get_catalog():
         flash("Invalid asset.")
         return redirect('/account')
-    ticker = yf.Ticker(symbol)
-    info = ticker.info
-    name = info.get('longName', get_asset_name(symbol))
-    current_price = info.get('currentPrice', info.get('regularMarketPrice', 0.0))
-    return render_template('stats.html', symbol=symbol, name=name, price=current_price)
+    name = get_asset_name(symbol)
+    price, fresh = get_quotes([symbol]).get(symbol, (None, False))
+    return render_template('stats.html', symbol=symbol, name=name, price=price, fresh=fresh,
+                           stream_interval=STREAM_INTERVAL)
 
 @app.route('/api/history/<symbol>/<period>')
 @login_required
 def api_history(symbol, period):
-    periods_map = {'1d': '1d', '7d': '7d', '1m': '1mo', '3m': '3mo', '6m': '6mo', '1y': '1y'}
-    p = periods_map.get(period, '1y')
-    interval = '1d' if p in ['1y', '6mo', '3mo', '1mo'] else '5m' if p == '1d' else '1h' if p == '7d' else '1d'
-    hist = yf.Ticker(symbol).history(period=p, interval=interval)
-    dates = hist.index.strftime('%Y-%m-%d %H:%M:%S').tolist()
-    prices = hist['Close'].tolist()
-    return jsonify({'dates': dates, 'prices': prices})
+    # ?max_points=N downsamples with LTTB; ?format=compact returns {'t': [epoch], 'c': [close]}
+    if symbol not in get_catalog() and symbol not in held_symbols():
+        return jsonify({'error': 'unknown symbol'}), 404
+    periods_map = {'1d': ('5m', 5), '7d': ('1h', 7), '1m': ('1d', 31), '3m': ('1d', 92), '6m': ('1d', 183),
+                   '1y': ('1d', 366)}
+    period = period if period in periods_map else '1y'
+    max_points = request.args.get('max_points', 0, type=int)
+    compact = request.args.get('format') == 'compact'
+    key = (symbol, period, max_points, compact)
+    cached = chart_cache.get(key)
+    if cached is None:
+        interval, days = periods_map[period]
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        times, prices = bars.bars(symbol, interval, now - datetime.timedelta(days=days), now)
+        if period == '1d' and len(times):
+            # Only the most recent trading session, like yfinance's period='1d'
+            session_start = to_epoch(datetime.datetime.combine(from_epoch(times[-1]).date(), datetime.time(0, 0)))
+            first = np.searchsorted(times, session_start)
+            times, prices = times[first:], prices[first:]
+        if max_points:
+            times, prices = lttb(times, prices, max_points)
+        if compact:
+            body = {'t': times.tolist(), 'c': prices.tolist()}
+        else:
+            body = {'dates': [from_epoch(t).strftime('%Y-%m-%d %H:%M:%S') for t in times], 'prices': prices.tolist()}
+        cached = chart_cache.put(key, json.dumps(body, separators=(',', ':')).encode(), CHART_TTL[interval])
+    payload, etag = cached
+    response = Response(payload, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def held_symbols():
+    user = load_user(session['username'])
+    return {symbol for typ in ['long', 'short'] for symbol in user['portfolio'][typ]}
+
+def watched_symbols():
+    # ?symbols=A,B from the catalog or the user's holdings, or None if invalid
+    held = held_symbols()
+    catalog = get_catalog()
+    symbols = [s for s in request.args.get('symbols', '').split(',') if s in catalog or s in held]
+    return symbols if symbols and len(symbols) <= STREAM_MAX_SYMBOLS else None
+
+@app.route('/stream/prices')
+@login_required
+def stream_prices():
+    # Server-Sent Events: {"symbol": ..., "price": ...} whenever a watched price
+    # changes. 503 once STREAM_MAX_CONNECTIONS streams are open in this process.
+    symbols = watched_symbols()
+    if symbols is None:
+        return jsonify({'error': 'invalid symbols'}), 400
+    if not stream_slots.acquire(blocking=False):
+        return jsonify({'error': 'too many open streams, poll /api/prices'}), 503
+    sub = price_hub.subscribe(symbols)
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+
+    def events():
+        while time.monotonic() < deadline:
+            tick = sub.get(timeout=STREAM_HEARTBEAT)
+            if tick is None:
+                yield ': heartbeat\n\n'
+            else:
+                yield f"data: {json.dumps({'symbol': tick[0], 'price': tick[1]})}\n\n"
 
-@app.route('/buy/<symbol>', methods=['POST'])
+    def close():
+        # Runs when the server closes the response, even if it never started iterating
+        price_hub.unsubscribe(sub)
+        stream_slots.release()
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.call_on_close(close)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/prices')
 @login_required
-def buy(symbol):
+def api_prices():
+    # Polling fallback for /stream/prices: {symbol: price} for ?symbols=A,B
+    symbols = watched_symbols()
+    if symbols is None:
+        return jsonify({'error': 'invalid symbols'}), 400
+    return jsonify(get_prices(symbols, max_age=STREAM_INTERVAL))
+
+def parse_stops(form):
+    stop_loss_str = form.get('stop_loss', '')
+    stop_profit_str = form.get('stop_profit', '')
+    stop_loss = float(stop_loss_str) if stop_loss_str else None
+    stop_profit = float(stop_profit_str) if stop_profit_str else None
+    return stop_loss, stop_profit
+
+def trade(action, symbol, success):
+    # Shared body of the single-symbol trade routes
     username = session['username']
     user = load_user(username)
     try:
         amount = int(request.form['amount'])
         if amount < 1:
             raise ValueError
-        stop_loss_str = request.form.get('stop_loss', '')
-        stop_profit_str = request.form.get('stop_profit', '')
-        stop_loss = float(stop_loss_str) if stop_loss_str else None
-        stop_profit = float(stop_profit_str) if stop_profit_str else None
+        stop_loss, stop_profit = parse_stops(request.form) if action != 'sell_cover' else (None, None)
     except ValueError:
-        flash("Invalid amount or stop levels.")
+        flash("Invalid amount." if action == 'sell_cover' else "Invalid amount or stop levels.")
         return redirect(f'/stats/{symbol}')
-    price = get_current_price(symbol)
-    cost = amount * price
-    commission_rate = user['commission_rate']
-    commission = cost * commission_rate
-    total_cost = cost + commission
-    if user['current_balance'] < total_cost:
-        flash("Insufficient balance.")
+    price = quotes.get_price(symbol, max_age=TRADE_QUOTE_MAX_AGE, lane='trade')
+    if price is None:
+        flash("No current quote for this asset, so the order was not placed. Please try again shortly.")
+        return redirect(f'/stats/{symbol}')
+    order = {'action': action, 'symbol': symbol, 'amount': amount, 'stop_loss': stop_loss, 'stop_profit': stop_profit}
+    try:
+        execute(user, order, price, datetime.datetime.now())
+    except OrderError as e:
+        flash(str(e))
         return redirect(f'/stats/{symbol}')
-    user['current_balance'] -= total_cost
-    if symbol in user['portfolio']['long']:
-        pos = user['portfolio']['long'][symbol]
-        old_am = pos['amount']
-        old_pr = pos['avg_price']
-        new_am = old_am + amount
-        new_pr = (old_am * old_pr + amount * price) / new_am
-        pos['avg_price'] = new_pr
-        pos['amount'] = new_am
-    else:
-        user['portfolio']['long'][symbol] = {'amount': amount, 'avg_price': price}
-    user['portfolio']['long'][symbol]['stop_loss'] = stop_loss
-    user['portfolio']['long'][symbol]['stop_profit'] = stop_profit
-    tx = {'datetime': datetime.datetime.now().isoformat(), 'action': 'buy', 'symbol': symbol, 'amount': amount,
-          'price': price, 'commission': commission, 'stop_loss': stop_loss, 'stop_profit': stop_profit}
-    user['transactions'].append(tx)
     save_user(username, user)
-    flash("Buy successful.")
+    stop_book.sync_user(username, user)
+    flash(success)
     return redirect(f'/stats/{symbol}')
 
+@app.route('/buy/<symbol>', methods=['POST'])
+@login_required
+@user_locked
+def buy(symbol):
+    return trade('buy', symbol, "Buy successful.")
+
 @app.route('/short/<symbol>', methods=['POST'])
 @login_required
+@user_locked
 def short(symbol):
-    username = session['username']
-    user = load_user(username)
-    try:
-        amount = int(request.form['amount'])
-        if amount < 1:
-            raise ValueError
-        stop_loss_str = request.form.get('stop_loss', '')
-        stop_profit_str = request.form.get('stop_profit', '')
-        stop_loss = float(stop_loss_str) if stop_loss_str else None
-        stop_profit = float(stop_profit_str) if stop_profit_str else None
-    except ValueError:
-        flash("Invalid amount or stop levels.")
-        return redirect(f'/stats/{symbol}')
-    price = get_current_price(symbol)
-    cost = amount * price
-    commission_rate = user['commission_rate']
-    commission = cost * commission_rate
-    total_cost = cost + commission
-    if user['current_balance'] < total_cost:
-        flash("Insufficient balance.")
-        return redirect(f'/stats/{symbol}')
-    user['current_balance'] -= total_cost
-    if symbol in user['portfolio']['short']:
-        pos = user['portfolio']['short'][symbol]
-        old_am = pos['amount']
-        old_pr = pos['avg_price']
-        new_am = old_am + amount
-        new_pr = (old_am * old_pr + amount * price) / new_am
-        pos['avg_price'] = new_pr
-        pos['amount'] = new_am
-    else:
-        user['portfolio']['short'][symbol] = {'amount': amount, 'avg_price': price}
-    user['portfolio']['short'][symbol]['stop_loss'] = stop_loss
-    user['portfolio']['short'][symbol]['stop_profit'] = stop_profit
-    tx = {'datetime': datetime.datetime.now().isoformat(), 'action': 'short', 'symbol': symbol, 'amount': amount,
-          'price': price, 'commission': commission, 'stop_loss': stop_loss, 'stop_profit': stop_profit}
-    user['transactions'].append(tx)
-    save_user(username, user)
-    flash("Short successful.")
-    return redirect(f'/stats/{symbol}')
+    return trade('short', symbol, "Short successful.")
 
 @app.route('/sell_cover/<symbol>', methods=['POST'])
 @login_required
+@user_locked
 def sell_cover(symbol):
+    return trade('sell_cover', symbol, "Sell/Cover successful.")
+
+@app.route('/api/orders', methods=['POST'])
+@login_required
+@user_locked
+def api_orders():
+    # {"orders": [{"action": "buy"|"short"|"sell_cover", "symbol", "amount",
+    # "stop_loss", "stop_profit"}, ...]}. Orders are priced with one bulk quote
+    # fetch and applied in order to the loaded account; cash and holdings are
+    # checked as each one applies. Either every order fills and the account is
+    # written once, or nothing is saved and the error names the failing order.
     username = session['username']
     user = load_user(username)
-    try:
-        amount = int(request.form['amount'])
-        if amount < 1:
-            raise ValueError
-    except ValueError:
-        flash("Invalid amount.")
-        return redirect(f'/stats/{symbol}')
-    price = get_current_price(symbol)
-    commission_rate = user['commission_rate']
-    commission = amount * price * commission_rate
-    found = False
-    revenue = 0
-    if symbol in user['portfolio']['long']:
-        pos = user['portfolio']['long'][symbol]
-        if pos['amount'] < amount:
-            flash("Insufficient amount in portfolio.")
-            return redirect(f'/stats/{symbol}')
-        revenue = amount * price
-        pos['amount'] -= amount
-        if pos['amount'] == 0:
-            del user['portfolio']['long'][symbol]
-        found = True
-    elif symbol in user['portfolio']['short']:
-        pos = user['portfolio']['short'][symbol]
-        if pos['amount'] < amount:
-            flash("Insufficient amount in portfolio.")
-            return redirect(f'/stats/{symbol}')
-        revenue = amount * (2 * pos['avg_price'] - price)
-        pos['amount'] -= amount
-        if pos['amount'] == 0:
-            del user['portfolio']['short'][symbol]
-        found = True
-    if not found:
-        flash("No position to sell/cover.")
-        return redirect(f'/stats/{symbol}')
-    user['current_balance'] += revenue - commission
-    tx = {'datetime': datetime.datetime.now().isoformat(), 'action': 'sell_cover', 'symbol': symbol, 'amount': amount,
-          'price': price, 'commission': commission, 'stop_loss': None, 'stop_profit': None}
-    user['transactions'].append(tx)
+    body = request.get_json(silent=True)
+    raw_orders = body.get('orders') if isinstance(body, dict) else None
+    if not isinstance(raw_orders, list) or not 0 < len(raw_orders) <= MAX_BATCH_ORDERS:
+        return jsonify({'error': f"Send between 1 and {MAX_BATCH_ORDERS} orders."}), 400
+    orders = []
+    for i, raw in enumerate(raw_orders):
+        try:
+            orders.append(parse_order(raw, user, get_catalog()))
+        except OrderError as e:
+            return jsonify({'error': str(e), 'index': i}), 400
+    prices = get_prices({order['symbol'] for order in orders}, max_age=TRADE_QUOTE_MAX_AGE, lane='trade')
+    now = datetime.datetime.now()
+    fills = []
+    for i, order in enumerate(orders):
+        price = prices.get(order['symbol'])
+        try:
+            if price is None:
+                raise OrderError(f"No quote for {order['symbol']}.")
+            fills.append(execute(user, order, price, now))
+        except OrderError as e:
+            return jsonify({'error': str(e), 'index': i}), 400
     save_user(username, user)
-    flash("Sell/Cover successful.")
-    return redirect(f'/stats/{symbol}')
+    stop_book.sync_user(username, user)
+    return jsonify({'fills': fills, 'balance': user['current_balance']})
 
-@app.route('/search', methods=['POST'])
+@app.route('/leaderboard')
+@login_required
+def leaderboard_page():
+    sort = request.args.get('sort', 'value')
+    sort = sort if sort in SORT_KEYS else 'value'
+    page = max(request.args.get('page', 1, type=int), 1)
+    result = analytics.get()
+    rows, total = leaderboard(result, sort, offset=(page - 1) * LEADERBOARD_PAGE_SIZE, limit=LEADERBOARD_PAGE_SIZE)
+    pages = max((total + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE, 1)
+    updated = datetime.datetime.fromtimestamp(result['computed_at'])
+    return render_template('leaderboard.html', rows=rows, sort=sort, page=page, pages=pages, total=total,
+                           exposure=exposure(result, limit=20), updated=updated)
+
+@app.route('/api/leaderboard')
+@login_required
+def api_leaderboard():
+    sort = request.args.get('sort', 'value')
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', LEADERBOARD_PAGE_SIZE, type=int), 1), 500)
+    result = analytics.get()
+    rows, total = leaderboard(result, sort, offset, limit)
+    return jsonify({'accounts': rows, 'total': total, 'computed_at': result['computed_at'],
+                    'exposure': exposure(result, limit=limit)})
+
+@app.route('/search', methods=['GET', 'POST'])
 @login_required
 def search():
-    query = request.form.get('query', '').lower()
-    results = [a for a in all_assets if query in a['name'].lower() or query in a['symbol'].lower()]
-    return render_template('search.html', results=results)
-
-def datetimeformat(value):
-    return datetime.datetime.fromisoformat(value).strftime('%Y %b %d %H:%M:%S')
+    query = request.values.get('query', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    results, total = get_catalog().search(query, offset=(page - 1) * SEARCH_PAGE_SIZE, limit=SEARCH_PAGE_SIZE)
+    pages = max((total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE, 1)
+    return render_template('search.html', results=results, query=query, page=page, pages=pages, total=total)
 
-app.jinja_env.filters['datetimeformat'] = datetimeformat
+@app.route('/api/assets/search')
+@login_required
+def api_asset_search():
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
+    results, total = get_catalog().search(request.args.get('q', ''), limit=limit)
+    return jsonify({'results': results, 'total': total})
+
+trigger_engine = TriggerEngine(stop_book, perform_auto_close,
+                               lambda symbols: get_prices(symbols, max_age=TRIGGER_MIN_INTERVAL, lane='stops'),
+                               min_interval=TRIGGER_MIN_INTERVAL, max_interval=TRIGGER_MAX_INTERVAL,
+                               refresh=refresh_stop_book)
+# Quotes polled for streaming pages are free ticks for the stops on those symbols
+price_hub.add_listener(lambda symbol, price: stop_book.loaded and trigger_engine.on_tick(symbol, price))
 
 scheduler = BackgroundScheduler()
 scheduler.add_job(func=check_positions, trigger="interval", minutes=10)
-scheduler.start()
+scheduler.add_job(func=assets.refresh_if_stale, trigger="interval", hours=1)
+scheduler_lock = FileLock(SCHEDULER_LOCK)
 
-if __name__ == '__main__':
+def run_background():
     catch_up()
+    refresh_stop_book()
+    scheduler.start()
+    trigger_engine.start()
+
+def start_background():
+    # Exactly one process per data directory runs catch_up, the scheduler and the
+    # trigger engine: whoever holds SCHEDULER_LOCK. Other processes wait on the lock
+    # in a thread and take over if the owner exits.
+    if scheduler_lock.acquire(blocking=False):
+        run_background()
+    else:
+        def wait_for_lock():
+            scheduler_lock.acquire()
+            run_background()
+        threading.Thread(target=wait_for_lock, name='scheduler-election', daemon=True).start()
+
+if __name__ == '__main__':
+    start_background()
     app.run(debug=True)
@@ -0,0 +1,180 @@
+# Strategy backtests over historical bars, using the same fill, commission and
+# stop logic as live trading (trading.py), entirely in memory.
+#
+# python backtest.py module:function SYMBOL [SYMBOL ...] [--interval 1d]
+#                    [--start 2020-01-01] [--end 2024-01-01] [--every 1]
+#                    [--balance 100000] [--commission 0.00005]
+#
+# The strategy is called every `every` bars with a Context and returns a list of
+# orders in the /api/orders format ({'action', 'symbol', 'amount', 'stop_loss',
+# 'stop_profit'}), filled at that bar's close. Between calls, stops are checked
+# against every bar's close with trading.first_trigger over the whole stretch at
+# once, and the equity curve is computed per stretch of unchanged holdings as
+# array arithmetic, so cost grows with the number of strategy calls and trades
+# rather than with bars x symbols.
+import argparse
+import datetime
+import importlib
+
+import numpy as np
+
+from barstore import from_epoch
+from trading import OrderError, apply_auto_close, execute, first_trigger, parse_order
+
+
+def load_closes(bars, symbols, interval, start, end):
+    # Closes of every symbol on the union of their bar times, forward filled;
+    # NaN before a symbol's first bar. Returns (times, closes[symbol, time]).
+    series = [bars.bars(symbol, interval, start, end) for symbol in symbols]
+    times = np.unique(np.concatenate([t for t, _ in series] + [np.zeros(0, np.int64)]))
+    closes = np.full((len(symbols), len(times)), np.nan)
+    for row, (t, close) in zip(closes, series):
+        if len(t):
+            idx = np.searchsorted(t, times, side='right') - 1
+            row[idx >= 0] = close[idx[idx >= 0]]
+    return times, closes
+
+
+class Context:
+    # What a strategy sees at bar t: history up to and including t, never after
+    def __init__(self, times, closes, symbols, user):
+        self.symbols = symbols
+        self.index = {symbol: i for i, symbol in enumerate(symbols)}
+        self.user = user
+        self._times = times
+        self._closes = closes
+        self.t = 0
+
+    @property
+    def time(self):
+        return from_epoch(self._times[self.t])
+
+    @property
+    def closes(self):
+        return self._closes[:, :self.t + 1]
+
+    def history(self, symbol):
+        return self._closes[self.index[symbol], :self.t + 1]
+
+    def price(self, symbol):
+        return float(self._closes[self.index[symbol], self.t])
+
+    @property
+    def balance(self):
+        return self.user['current_balance']
+
+    @property
+    def positions(self):
+        return self.user['portfolio']
+
+
+def _holdings_value(user, index, closes, lo, hi):
+    # Account value at each bar in [lo, hi) with the current holdings
+    value = np.full(hi - lo, user['current_balance'])
+    for typ in ['long', 'short']:
+        positions = user['portfolio'][typ]
+        if not positions:
+            continue
+        rows = [index[symbol] for symbol in positions]
+        amount = np.array([pos['amount'] for pos in positions.values()], dtype=np.float64)[:, None]
+        avg = np.array([pos['avg_price'] for pos in positions.values()], dtype=np.float64)[:, None]
+        prices = closes[rows, lo:hi]
+        prices = np.where(np.isnan(prices), avg, prices)
+        value += (amount * (prices if typ == 'long' else 2 * avg - prices)).sum(axis=0)
+    return value
+
+
+def run(strategy, times, closes, symbols, initial_balance=100000.0, commission_rate=0.00005, every=1, start=0):
+    # Returns {'times', 'equity', 'trades', 'rejected', 'user'}; equity is the
+    # account value at every bar's close, after that bar's fills.
+    initial_balance = float(initial_balance)
+    user = {'initial_balance': initial_balance, 'current_balance': initial_balance,
+            'commission_rate': commission_rate, 'portfolio': {'long': {}, 'short': {}}, 'transactions': []}
+    ctx = Context(times, closes, symbols, user)
+    n = len(times)
+    equity = np.full(n, initial_balance)
+    rejected = []
+    for t in range(start, n, every):
+        ctx.t = t
+        for order in strategy(ctx) or []:
+            try:
+                parsed = parse_order(order, user, ctx.index)
+                price = closes[ctx.index[parsed['symbol']], t]
+                if not price > 0:
+                    raise OrderError(f"No price for {parsed['symbol']}.")
+                execute(user, parsed, float(price), ctx.time)
+            except OrderError as e:
+                rejected.append((ctx.time, order, str(e)))
+        # Stops over the bars up to and including the next strategy call's bar,
+        # earliest first; a hit on that bar is applied before the strategy runs
+        stop = min(t + every, n)
+        end = min(t + every + 1, n)
+        hits = []
+        for typ in ['long', 'short']:
+            for symbol, pos in user['portfolio'][typ].items():
+                if pos.get('stop_loss') is None and pos.get('stop_profit') is None:
+                    continue
+                i, action_type = first_trigger(typ, closes[ctx.index[symbol], t + 1:end], pos)
+                if i is not None:
+                    hits.append((t + 1 + i, typ, symbol, action_type))
+        lo = t
+        for hit, typ, symbol, action_type in sorted(hits):
+            equity[lo:hit] = _holdings_value(user, ctx.index, closes, lo, hit)
+            apply_auto_close(user, typ, symbol, float(closes[ctx.index[symbol], hit]), action_type,
+                             from_epoch(times[hit]))
+            lo = hit
+        equity[lo:stop] = _holdings_value(user, ctx.index, closes, lo, stop)
+    return {'times': times, 'equity': equity, 'trades': user['transactions'], 'rejected': rejected, 'user': user}
+
+
+def summary(result):
+    equity = result['equity']
+    if not len(equity):
+        return {'return': 0.0, 'max_drawdown': 0.0, 'trades': 0}
+    peak = np.maximum.accumulate(equity)
+    return {
+        'return': float(equity[-1] / equity[0] - 1) * 100,
+        'max_drawdown': float((equity / peak - 1).min()) * 100,
+        'trades': len(result['trades']),
+    }
+
+
+def buy_and_hold(ctx):
+    # Example strategy: on the first bar, spread the balance evenly across symbols
+    if ctx.t > 0 or ctx.user['transactions']:
+        return []
+    budget = ctx.balance / len(ctx.symbols) / (1 + ctx.user['commission_rate'])
+    return [{'action': 'buy', 'symbol': symbol, 'amount': int(budget // ctx.price(symbol))}
+            for symbol in ctx.symbols if ctx.price(symbol) > 0 and budget >= ctx.price(symbol)]
+
+
+def main():
+    from barstore import BarStore
+    from marketdata import AsyncMarketData
+    parser = argparse.ArgumentParser(description='Backtest a strategy function over historical bars.')
+    parser.add_argument('strategy', help='module:function, e.g. backtest:buy_and_hold')
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--interval', default='1d', choices=['5m', '1h', '1d'])
+    parser.add_argument('--start', type=datetime.date.fromisoformat, default=datetime.date.today() - datetime.timedelta(days=365))
+    parser.add_argument('--end', type=datetime.date.fromisoformat, default=datetime.date.today())
+    parser.add_argument('--every', type=int, default=1, help='bars between strategy calls')
+    parser.add_argument('--balance', type=float, default=100000.0)
+    parser.add_argument('--commission', type=float, default=0.00005)
+    parser.add_argument('--bar-dir', default='data/bars')
+    args = parser.parse_args()
+    module, function = args.strategy.split(':')
+    strategy = getattr(importlib.import_module(module), function)
+    bars = BarStore(args.bar_dir, AsyncMarketData().fetch_bars)
+    start = datetime.datetime.combine(args.start, datetime.time(0, 0))
+    end = datetime.datetime.combine(args.end, datetime.time(0, 0))
+    times, closes = load_closes(bars, args.symbols, args.interval, start, end)
+    result = run(strategy, times, closes, args.symbols, args.balance, args.commission, args.every)
+    stats = summary(result)
+    print(f"{len(times)} bars x {len(args.symbols)} symbols, {stats['trades']} trades, "
+          f"{len(result['rejected'])} rejected orders")
+    print(f"return {stats['return']:.2f}%  max drawdown {stats['max_drawdown']:.2f}%  "
+          f"final value {result['equity'][-1] if len(times) else args.balance:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from locks import FileLock
+
+BAR_DTYPE = np.dtype([('t', '<i8'), ('close', '<f8')])
+INTERVAL_SECONDS = {'5m': 300, '1h': 3600, '1d': 86400}
+# How far a download is widened around a missing range, so that walking
+# forward day by day costs one request per chunk instead of one per day.
+FETCH_CHUNK = {'5m': 7 * 86400, '1h': 30 * 86400, '1d': 365 * 86400}
+# Yahoo only serves intraday bars this far back; older ranges are empty by definition.
+MAX_HISTORY = {'5m': 59 * 86400, '1h': 729 * 86400}
+# Unsettled bars near now are kept in memory as covered for this long before refetching.
+TAIL_TTL = {'5m': 60, '1h': 300, '1d': 900}
+
+
+# Naive datetimes are treated as UTC, matching the tz_convert(None) comparisons
+# the app has always made against yfinance indexes.
+def to_epoch(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return int(dt.timestamp())
+
+
+def from_epoch(ts):
+    return datetime.datetime.fromtimestamp(int(ts), datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class BarStore:
+    # On-disk close-price store: one memory-mapped .npy file per symbol and interval,
+    # plus a small .json sidecar listing the time ranges already downloaded. Only the
+    # ranges not yet covered are ever requested from the fetcher, a callable taking
+    # (symbol, start_epoch, end_epoch, interval) and returning (times, closes) arrays.
+    def __init__(self, root, fetcher):
+        self.root = root
+        self.fetcher = fetcher
+        self._series = {}
+        self._tails = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def set_fetcher(self, fetcher):
+        with self._lock:
+            self.fetcher = fetcher
+
+    def _paths(self, symbol, interval):
+        base = os.path.join(self.root, interval, symbol.replace('/', '_'))
+        return base + '.npy', base + '.json'
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _load(self, symbol, interval):
+        key = (symbol, interval)
+        series = self._series.get(key)
+        if series is None:
+            data_path, meta_path = self._paths(symbol, interval)
+            if os.path.exists(data_path) and os.path.exists(meta_path):
+                bars = np.load(data_path, mmap_mode='r')
+                with open(meta_path, 'r') as f:
+                    coverage = json.load(f)['coverage']
+            else:
+                bars = np.empty(0, dtype=BAR_DTYPE)
+                coverage = []
+            series = (bars, coverage)
+            self._series[key] = series
+        return series
+
+    def _write(self, symbol, interval, bars, coverage):
+        data_path, meta_path = self._paths(symbol, interval)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        tmp = data_path + '.tmp.npy'
+        np.save(tmp, bars)
+        os.replace(tmp, data_path)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'coverage': coverage}, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        self._series[(symbol, interval)] = (np.load(data_path, mmap_mode='r'), coverage)
+
+    def _widen(self, lo, hi, prev_end, next_start, interval):
+        chunk = FETCH_CHUNK[interval]
+        limit = int(time.time()) if next_start is None else min(next_start, int(time.time()))
+        lo = lo - chunk if prev_end is None else max(lo - chunk, prev_end)
+        return lo, max(hi, min(hi + chunk, limit))
+
+    def _gaps(self, coverage, start, end, interval):
+        gaps = []
+        cursor = start
+        prev_end = None
+        for cov_start, cov_end in coverage:
+            if cov_end <= cursor:
+                prev_end = cov_end
+                continue
+            if cov_start > cursor:
+                gaps.append(self._widen(cursor, min(cov_start, end), prev_end, cov_start, interval))
+            if cov_end >= end:
+                return gaps
+            cursor = cov_end
+            prev_end = cov_end
+        if cursor < end:
+            gaps.append(self._widen(cursor, end, prev_end, None, interval))
+        return gaps
+
+    def _missing(self, symbol, interval, start, end):
+        bars, coverage = self._load(symbol, interval)
+        known = coverage
+        tail = self._tails.get((symbol, interval))
+        if tail is not None and time.monotonic() - tail[2] < TAIL_TTL[interval]:
+            known = _merge_ranges(coverage + [tail[:2]])
+        return bars, coverage, self._gaps(known, start, end, interval)
+
+    def ensure(self, symbol, interval, start, end):
+        # Bars that may still change (the last interval before now) are never
+        # persisted as covered; they are only trusted for TAIL_TTL seconds.
+        settled = int(time.time()) - INTERVAL_SECONDS[interval]
+        with self._key_lock((symbol, interval)):
+            if not self._missing(symbol, interval, start, end)[2]:
+                return
+            data_path, _ = self._paths(symbol, interval)
+            os.makedirs(os.path.dirname(data_path), exist_ok=True)
+            with FileLock(data_path + '.lock'):
+                # Another worker process may have filled the range while we waited
+                self._series.pop((symbol, interval), None)
+                bars, coverage, gaps = self._missing(symbol, interval, start, end)
+                if not gaps:
+                    return
+                parts = []
+                new_ranges = []
+                oldest = int(time.time()) - MAX_HISTORY[interval] if interval in MAX_HISTORY else None
+                for lo, hi in gaps:
+                    fetch_lo = lo if oldest is None else max(lo, oldest)
+                    if hi > fetch_lo:
+                        try:
+                            t, close = self.fetcher(symbol, fetch_lo, hi, interval)
+                        except Exception as e:
+                            # Leave the range uncovered so it is retried on the next lookup
+                            logging.getLogger(__name__).warning("Bar fetch failed for %s %s: %s", symbol, interval, e)
+                            continue
+                        part = np.empty(len(t), dtype=BAR_DTYPE)
+                        part['t'] = t
+                        part['close'] = close
+                        parts.append(part[~np.isnan(part['close'])])
+                    if min(hi, settled) > lo:
+                        new_ranges.append([lo, min(hi, settled)])
+                    if hi > settled:
+                        # No bar can start before the next interval boundary, so the
+                        # tail covers up to it and requests ending "now" a moment
+                        # later don't refetch
+                        step = INTERVAL_SECONDS[interval]
+                        self._tails[(symbol, interval)] = [max(lo, settled), (hi // step + 1) * step,
+                                                           time.monotonic()]
+                covered = _merge_ranges(coverage + new_ranges)
+                if not parts and covered == coverage:
+                    return  # Every fetch failed: nothing new to persist
+                combined = np.concatenate(parts + [np.asarray(bars)])
+                _, first = np.unique(combined['t'], return_index=True)
+                self._write(symbol, interval, combined[first], covered)
+
+    def bars(self, symbol, interval, start, end):
+        start, end = to_epoch(start), to_epoch(end)
+        self.ensure(symbol, interval, start, end)
+        bars, _ = self._load(symbol, interval)
+        lo, hi = np.searchsorted(bars['t'], [start, end], side='left')
+        return np.asarray(bars['t'][lo:hi]), np.asarray(bars['close'][lo:hi])
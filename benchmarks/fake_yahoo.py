@@ -0,0 +1,95 @@
+# Local stand-in for the Yahoo chart API, serving deterministic prices so the
+# market-data client can be exercised offline. Latency and error injection are
+# configurable. Run: python benchmarks/fake_yahoo.py [port] [latency_s] [error_rate]
+import json
+import math
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+INTERVAL_SECONDS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+
+
+def price_at(symbol, t):
+    seed = zlib.crc32(symbol.encode())
+    base = 20 + seed % 480
+    return round(base * (1 + 0.1 * math.sin(t / 86400.0 + seed % 17)), 4)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # The default backlog of 5 serializes concurrent clients
+
+
+class FakeYahoo:
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                owner.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = _Server(('127.0.0.1', port), Handler)
+        self.port = self.server.server_address[1]
+        self.chart_url = f"http://127.0.0.1:{self.port}/v8/finance/chart/{{symbol}}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, request):
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            request.send_response(503)
+            request.end_headers()
+            return
+        url = urlsplit(request.path)
+        symbol = unquote(url.path.rsplit('/', 1)[-1])
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        step = INTERVAL_SECONDS.get(params.get('interval', '1d'), 86400)
+        now = int(time.time())
+        if 'period1' in params:
+            start, end = int(params['period1']), min(int(params['period2']), now)
+        else:
+            start, end = now - 86400, now
+        times = list(range((start // step + 1) * step, end, step))
+        body = {'chart': {'result': [{
+            'meta': {'symbol': symbol, 'regularMarketPrice': price_at(symbol, now)},
+            'timestamp': times,
+            'indicators': {'quote': [{'close': [price_at(symbol, t) for t in times]}]},
+        }], 'error': None}}
+        payload = json.dumps(body).encode()
+        request.send_response(200)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    fake = FakeYahoo(port, latency, error_rate)
+    print(f"Serving fake Yahoo chart API on {fake.chart_url}")
+    fake.server.serve_forever()
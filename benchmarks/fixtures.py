@@ -0,0 +1,158 @@
+# Offline market data and synthetic accounts for the benchmark suite.
+#
+# FixtureMarket stands in for AsyncMarketData (fetch_prices / fetch_bars). Bars
+# come from a recording made with `python benchmarks/fixtures.py record out.npz`
+# on a machine with network access, shifted so the recording ends now; symbols
+# or intervals missing from the recording (or every symbol, without one) fall
+# back to the deterministic series fake_yahoo serves.
+import datetime
+import os
+import random
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from barstore import INTERVAL_SECONDS
+from fake_yahoo import price_at
+
+SYNTHETIC_STOCKS = [f"S{i:03d}" for i in range(500)]  # Stand-ins for the S&P 500 constituents
+RECORD_INTERVALS = {'5m': 59, '1h': 365, '1d': 5 * 365}  # Interval -> days of history to record
+SCALES = {
+    # users, open positions per user, transactions per user, account age in days
+    'small': dict(users=50, positions=5, transactions=200, age_days=90),
+    'medium': dict(users=500, positions=10, transactions=2000, age_days=365),
+    'large': dict(users=2000, positions=20, transactions=20000, age_days=3 * 365),
+}
+
+
+class FixtureMarket:
+    def __init__(self, recording=None):
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._series = {}
+        self._shift = 0
+        if recording:
+            data = np.load(recording)
+            for key in data.files:
+                symbol, interval, column = key.rsplit('|', 2)
+                self._series.setdefault((symbol, interval), {})[column] = data[key]
+            ends = [series['t'][-1] for series in self._series.values() if len(series['t'])]
+            if ends:
+                self._shift = int(time.time()) - int(max(ends))
+
+    def symbols(self):
+        return sorted({symbol for symbol, _ in self._series})
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+    def fetch_prices(self, symbols, lane=None):
+        self._count()
+        now = int(time.time())
+        prices = {}
+        for symbol in symbols:
+            series = self._series.get((symbol, '5m'))
+            if series is not None and len(series['t']):
+                prices[symbol] = float(series['close'][-1])
+            else:
+                prices[symbol] = price_at(symbol, now)
+        return prices
+
+    def fetch_bars(self, symbol, start, end, interval):
+        self._count()
+        series = self._series.get((symbol, interval))
+        if series is not None:
+            t = series['t'] + self._shift
+            keep = (t >= start) & (t < end)
+            return t[keep], series['close'][keep]
+        step = INTERVAL_SECONDS[interval]
+        t = np.arange((int(start) // step + 1) * step, min(int(end), int(time.time())), step, dtype=np.int64)
+        return t, np.array([price_at(symbol, x) for x in t.tolist()], dtype=np.float64)
+
+
+def assets(market, commodities):
+    stocks = market.symbols() or SYNTHETIC_STOCKS
+    known = {c['symbol'] for c in commodities}
+    return [{'symbol': s, 'name': f"Fixture {s}"} for s in stocks if s not in known] + commodities
+
+
+def make_users(storage, symbols, users, positions, transactions, age_days, seed=7):
+    # Accounts with a ledger of round trips spread over their age, ending in
+    # `positions` open positions with stops a few percent either side of the
+    # current price. Returns the usernames.
+    rng = random.Random(seed)
+    now = datetime.datetime.now()
+    start = now - datetime.timedelta(days=age_days)
+    span = (now - start).total_seconds()
+    names = []
+    for n in range(users):
+        username = f"bench{n}"
+        balance = 10_000_000.0
+        txs = []
+        round_trips = max(transactions - positions, 0) // 2
+        for k in sorted(rng.random() for _ in range(round_trips)):
+            symbol = rng.choice(symbols)
+            opened = start + datetime.timedelta(seconds=k * span)
+            closed = opened + datetime.timedelta(hours=rng.uniform(1, 48))
+            typ = rng.choice(['buy', 'short'])
+            amount = rng.randint(1, 50)
+            for dt, action in [(opened, typ), (closed, 'sell_cover')]:
+                price = price_at(symbol, int(dt.timestamp()))
+                txs.append({'datetime': min(dt, now).isoformat(), 'action': action, 'symbol': symbol,
+                            'amount': amount, 'price': price, 'commission': amount * price * 0.00005,
+                            'stop_loss': None, 'stop_profit': None})
+        portfolio = {'long': {}, 'short': {}}
+        for symbol in rng.sample(symbols, positions):
+            typ = rng.choice(['long', 'short'])
+            price = price_at(symbol, int(now.timestamp()))
+            amount = rng.randint(1, 50)
+            below, above = price * rng.uniform(0.9, 0.99), price * rng.uniform(1.01, 1.1)
+            stops = (below, above) if typ == 'long' else (above, below)
+            portfolio[typ][symbol] = {'amount': amount, 'avg_price': price, 'stop_loss': stops[0],
+                                      'stop_profit': stops[1]}
+            txs.append({'datetime': (now - datetime.timedelta(minutes=rng.randint(1, 600))).isoformat(),
+                        'action': 'buy' if typ == 'long' else 'short', 'symbol': symbol, 'amount': amount,
+                        'price': price, 'commission': amount * price * 0.00005,
+                        'stop_loss': stops[0], 'stop_profit': stops[1]})
+            balance -= amount * price
+        storage.save_user(username, {
+            'password': 'x', 'initial_balance': 10_000_000.0, 'current_balance': balance,
+            'commission_rate': 0.00005, 'start_date': start, 'portfolio': portfolio, 'transactions': txs,
+        })
+        names.append(username)
+    return names
+
+
+def record(path, symbols):
+    # Record real bars for every symbol and interval into one .npz fixture
+    from marketdata import AsyncMarketData
+    market = AsyncMarketData()
+    now = int(time.time())
+    arrays = {}
+    for symbol in symbols:
+        for interval, days in RECORD_INTERVALS.items():
+            try:
+                t, close = market.fetch_bars(symbol, now - days * 86400, now, interval)
+            except Exception as e:
+                print(f"{symbol} {interval}: {e}")
+                continue
+            arrays[f"{symbol}|{interval}|t"] = t
+            arrays[f"{symbol}|{interval}|close"] = close
+    np.savez_compressed(path, **arrays)
+    print(f"Recorded {len(arrays) // 2} series into {path}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'record':
+        sys.exit("usage: python benchmarks/fixtures.py record out.npz [symbols...]")
+    if len(sys.argv) > 3:
+        symbols = sys.argv[3:]
+    else:
+        import app
+        symbols = [a['symbol'] for a in app.get_all_assets()]
+    record(sys.argv[2], symbols)
@@ -0,0 +1,119 @@
+# Replay recorded ticks through the TriggerEngine on a simulated clock and report
+# trigger latency (time from the first crossing tick to the fill) and CPU per tick,
+# next to a fixed 10-minute sweep over the same ticks.
+#
+# python benchmarks/replay_ticks.py [ticks.csv]
+# The CSV has rows of epoch,symbol,price sorted by time; without one, a day of
+# synthetic one-second random-walk ticks is generated.
+import csv
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stopbook import StopBook
+from triggers import TriggerEngine
+
+
+def synthetic_ticks(symbols=50, seconds=6 * 3600, seed=1):
+    rng = random.Random(seed)
+    prices = {f"SYM{i}": 100.0 for i in range(symbols)}
+    for t in range(seconds):
+        for symbol in prices:
+            prices[symbol] *= 1 + rng.gauss(0, 0.0005)
+            yield t, symbol, prices[symbol]
+
+
+def load_ticks(path):
+    with open(path, newline='') as f:
+        for epoch, symbol, price in csv.reader(f):
+            yield int(float(epoch)), symbol, float(price)
+
+
+def make_orders(symbols, users=2000, seed=2):
+    rng = random.Random(seed)
+    orders = []
+    for n in range(users):
+        symbol = rng.choice(symbols)
+        typ = rng.choice(['long', 'short'])
+        loss, profit = 100 * rng.uniform(0.95, 0.995), 100 * rng.uniform(1.005, 1.05)
+        if typ == 'short':
+            loss, profit = profit, loss
+        orders.append((f"user{n}", typ, symbol, loss, profit))
+    return orders
+
+
+def first_crossings(ticks, orders):
+    # Ground truth: the first tick at which each order's stop was crossed
+    by_symbol = defaultdict(list)
+    for order in orders:
+        by_symbol[order[2]].append(order)
+    crossed = {}
+    for t, symbol, price in ticks:
+        for username, typ, _, loss, profit in by_symbol[symbol]:
+            if (username, typ) in crossed:
+                continue
+            hit = price <= loss or price >= profit if typ == 'long' else price >= loss or price <= profit
+            if hit:
+                crossed[(username, typ)] = t
+    return crossed
+
+
+def replay(ticks, orders, engine_factory):
+    clock = [0]
+    latest = {}
+    book = StopBook()
+    users = []
+    for username, typ, symbol, loss, profit in orders:
+        portfolio = {'long': {}, 'short': {}}
+        portfolio[typ][symbol] = {'stop_loss': loss, 'stop_profit': profit}
+        users.append((username, {'portfolio': portfolio}))
+    book.ensure_loaded(lambda: users)
+    fills = {}
+
+    def close(username, typ, symbol, price, action_type):
+        fills[(username, typ)] = clock[0]
+        book.sync_user(username, {'portfolio': {'long': {}, 'short': {}}})
+
+    engine = engine_factory(book, close, lambda symbols: {s: latest[s] for s in symbols if s in latest},
+                            lambda: clock[0])
+    polls = 0
+    cpu = 0.0
+    next_due = 0
+    for t, symbol, price in ticks:
+        if t != clock[0] and clock[0] >= next_due:
+            start = time.process_time()
+            next_due = engine.poll()
+            cpu += time.process_time() - start
+            polls += 1
+        clock[0] = t
+        latest[symbol] = price
+    return fills, polls, cpu
+
+
+def report(name, truth, fills, polls, cpu):
+    latencies = sorted(fills[key] - truth[key] for key in fills if key in truth)
+    missed = len(set(truth) - set(fills))
+    median = latencies[len(latencies) // 2] if latencies else 0
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+    print(f"{name:>10}: fills {len(fills):>5}  missed {missed:>4}  latency median {median:>4}s  p95 {p95:>4}s  "
+          f"polls {polls:>6}  cpu/poll {cpu / max(polls, 1) * 1e6:>7.1f}us")
+
+
+def main():
+    ticks = list(load_ticks(sys.argv[1]) if len(sys.argv) > 1 else synthetic_ticks())
+    symbols = sorted({symbol for _, symbol, _ in ticks})
+    orders = make_orders(symbols)
+    truth = first_crossings(ticks, orders)
+    print(f"{len(ticks)} ticks, {len(symbols)} symbols, {len(orders)} orders, {len(truth)} crossings")
+    report('adaptive', truth, *replay(ticks, orders, lambda book, close, fetch, clock: TriggerEngine(
+        book, close, fetch, clock=clock)))
+    report('fixed 600s', truth, *replay(ticks, orders, lambda book, close, fetch, clock: TriggerEngine(
+        book, close, fetch, min_interval=600, max_interval=600, clock=clock)))
+
+
+if __name__ == '__main__':
+    main()
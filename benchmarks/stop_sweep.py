@@ -0,0 +1,82 @@
+# Compare a full-scan stop sweep against StopBook range queries on synthetic users.
+# Run from the repository root: python benchmarks/stop_sweep.py [users ...]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stopbook import StopBook
+
+SYMBOLS = [f"SYM{i}" for i in range(500)]
+
+
+def make_users(count, positions=5, seed=42):
+    rng = random.Random(seed)
+    users = []
+    for n in range(count):
+        portfolio = {'long': {}, 'short': {}}
+        for symbol in rng.sample(SYMBOLS, positions):
+            typ = rng.choice(['long', 'short'])
+            price = 100.0
+            if typ == 'long':
+                stops = (price * rng.uniform(0.8, 0.99), price * rng.uniform(1.01, 1.2))
+            else:
+                stops = (price * rng.uniform(1.01, 1.2), price * rng.uniform(0.8, 0.99))
+            portfolio[typ][symbol] = {'amount': 10, 'avg_price': price, 'stop_loss': stops[0], 'stop_profit': stops[1]}
+        users.append((f"user{n}", {'portfolio': portfolio}))
+    return users
+
+
+def scan_sweep(users, prices):
+    hits = []
+    for username, user in users:
+        for typ in ['long', 'short']:
+            for symbol, pos in user['portfolio'][typ].items():
+                price = prices[symbol]
+                sl, sp = pos['stop_loss'], pos['stop_profit']
+                if typ == 'long' and (price <= sl or price >= sp):
+                    hits.append((username, typ, symbol))
+                elif typ == 'short' and (price >= sl or price <= sp):
+                    hits.append((username, typ, symbol))
+    return hits
+
+
+def book_sweep(book, prices):
+    hits = []
+    for symbol in book.symbols():
+        for username, typ, _ in book.triggered(symbol, prices[symbol]):
+            hits.append((username, typ, symbol))
+    return hits
+
+
+def timed(fn, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(sizes):
+    rng = random.Random(7)
+    prices = {symbol: 100.0 * rng.uniform(0.98, 1.02) for symbol in SYMBOLS}
+    print(f"{'users':>8} {'orders':>8} {'build s':>9} {'scan ms':>9} {'book ms':>9} {'hits':>7}")
+    for size in sizes:
+        users = make_users(size)
+        book = StopBook()
+        start = time.perf_counter()
+        book.ensure_loaded(lambda: users)
+        build = time.perf_counter() - start
+        scan_time, scan_hits = timed(scan_sweep, users, prices)
+        book_time, book_hits = timed(book_sweep, book, prices)
+        assert sorted(scan_hits) == sorted(book_hits)
+        print(f"{size:>8} {book.size():>8} {build:>9.3f} {scan_time * 1000:>9.2f} {book_time * 1000:>9.2f} "
+              f"{len(book_hits):>7}")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [100, 1000, 10000])
@@ -0,0 +1,231 @@
+# Benchmark suite for the hot paths: /account, /account/history (page and first
+# data chunks), check_positions, catch_up and get_portfolio_value_at_date, on
+# synthetic accounts against offline market data (see fixtures.py). No network.
+#
+# python benchmarks/suite.py [--scale small|medium|large] [--repeat N]
+#                            [--recording bars.npz] [--save results.json]
+#                            [--compare baseline.json] [--threshold 1.25]
+#
+# Each scenario runs once to warm caches (reported as "first") and then --repeat
+# times; the median and min of those runs are reported with the
+# number of upstream market-data calls per run. --compare exits non-zero if any
+# median is slower than the baseline by more than --threshold.
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import fixtures
+
+
+class Context:
+    # The app imported into a scratch directory, wired to a FixtureMarket, with a
+    # copy of the freshly generated database to restore before mutating scenarios
+    def __init__(self, scale, recording):
+        self.workdir = tempfile.mkdtemp(prefix='bench-')
+        os.chdir(self.workdir)
+        os.makedirs('data', exist_ok=True)
+        self.market = fixtures.FixtureMarket(recording)
+        commodities = _commodities()
+        with open('data/assets.json', 'w') as f:
+            json.dump({'fetched_at': time.time(), 'assets': fixtures.assets(self.market, commodities)}, f)
+        import app
+        self.app = app
+        app.quotes.set_provider(self.market.fetch_prices)
+        app.bars.set_fetcher(self.market.fetch_bars)
+        symbols = [a['symbol'] for a in app.get_catalog().assets]
+        started = time.perf_counter()
+        self.users = fixtures.make_users(app.storage, symbols, **fixtures.SCALES[scale])
+        self.setup_seconds = time.perf_counter() - started
+        self.user = self.users[0]
+        self.client = app.app.test_client()
+        with self.client.session_transaction() as session:
+            session['username'] = self.user
+        conn = app.storage._conn()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self.pristine = os.path.join(self.workdir, 'pristine.db')
+        shutil.copy(app.DB_PATH, self.pristine)
+
+    def restore(self):
+        app = self.app
+        conn = getattr(app.storage._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+        app.storage._local = threading.local()
+        for suffix in ['-wal', '-shm']:
+            if os.path.exists(app.DB_PATH + suffix):
+                os.remove(app.DB_PATH + suffix)
+        shutil.copy(self.pristine, app.DB_PATH)
+        app.stop_book.reload(lambda: [])
+        app.stop_book.loaded = False
+        for username in self.users:
+            app.ledgers.invalidate(username)
+            app.profiles.invalidate(username)
+        app.quotes.invalidate()
+
+
+def _commodities():
+    # app.get_commodities without importing app before the scratch directory exists
+    import ast
+    with open(os.path.join(ROOT, 'app.py')) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == 'get_commodities':
+            return ast.literal_eval(node.body[0].value)
+    return []
+
+
+def _get(ctx, url):
+    response = ctx.client.get(url)
+    assert response.status_code == 200, (url, response.status_code)
+    return response
+
+
+def account(ctx):
+    _get(ctx, '/account')
+
+
+def history(ctx):
+    _get(ctx, '/account/history')
+    _get(ctx, '/api/account/equity')
+    _get(ctx, '/api/account/transactions')
+
+
+def history_chart(ctx):
+    _get(ctx, '/api/account/equity?days=0&max_points=400')
+
+
+def portfolio_value_cold(ctx):
+    ctx.app.get_portfolio_value_at_date(ctx.user, datetime.date.today())
+
+
+def reset_valuation(ctx):
+    ctx.app.storage._conn().execute('DELETE FROM snapshots WHERE username = ?', (ctx.user,))
+    ctx.app.ledgers.invalidate(ctx.user)
+
+
+def portfolio_value_warm(ctx):
+    ctx.app.get_portfolio_value_at_date(ctx.user, datetime.date.today())
+
+
+def check_positions(ctx):
+    ctx.app.check_positions()
+
+
+def catch_up(ctx):
+    ctx.app.catch_up()
+
+
+def reset_catch_up(ctx):
+    ctx.restore()
+    with open(ctx.app.SERVER_DATA, 'w') as f:
+        json.dump({'last_check': (datetime.datetime.now() - datetime.timedelta(days=1)).isoformat()}, f)
+
+
+# name, timed function, untimed setup run before every repetition (or None)
+SCENARIOS = [
+    ('account', account, None),
+    ('history', history, None),
+    ('history_chart', history_chart, None),
+    ('portfolio_value_cold', portfolio_value_cold, reset_valuation),
+    ('portfolio_value_warm', portfolio_value_warm, None),
+    ('check_positions', check_positions, lambda ctx: ctx.restore()),
+    ('catch_up', catch_up, reset_catch_up),
+]
+
+
+def run(ctx, repeat, only=None):
+    results = {}
+    for name, fn, setup in SCENARIOS:
+        if only and name not in only:
+            continue
+        runs, calls = [], []
+        for n in range(repeat + 1):
+            if setup is not None:
+                setup(ctx)
+            before = ctx.market.calls
+            started = time.perf_counter()
+            fn(ctx)
+            elapsed = time.perf_counter() - started
+            if n == 0:
+                first = elapsed
+            else:
+                runs.append(elapsed)
+                calls.append(ctx.market.calls - before)
+        results[name] = {'first': first, 'median': statistics.median(runs), 'min': min(runs),
+                         'upstream_calls': statistics.median(calls), 'runs': runs}
+        print(f"{name:>22}: first {first * 1e3:9.2f} ms  median {results[name]['median'] * 1e3:9.2f} ms  "
+              f"min {results[name]['min'] * 1e3:9.2f} ms  upstream calls {results[name]['upstream_calls']:g}")
+    return results
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    regressions = 0
+    print(f"\nvs {baseline_path}:")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['median'] / baseline[name]['median']
+        flag = '  REGRESSION' if ratio > threshold else ''
+        regressions += bool(flag)
+        print(f"{name:>22}: {ratio:6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', choices=sorted(fixtures.SCALES), default='small')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--recording', help='.npz of recorded bars from fixtures.py record')
+    parser.add_argument('--only', nargs='*', help='scenario names to run')
+    parser.add_argument('--save', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25)
+    args = parser.parse_args()
+    recording = os.path.abspath(args.recording) if args.recording else None
+    save = os.path.abspath(args.save) if args.save else None
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    ctx = Context(args.scale, recording)
+    print(f"scale {args.scale}: {fixtures.SCALES[args.scale]}  (generated in {ctx.setup_seconds:.1f}s)")
+    results = run(ctx, args.repeat, args.only)
+    if save:
+        os.makedirs(os.path.dirname(save), exist_ok=True)
+        with open(save, 'w') as f:
+            json.dump({
+                'meta': {'commit': _commit(), 'scale': args.scale, 'repeat': args.repeat, 'recording': args.recording,
+                         'python': platform.python_version(), 'machine': platform.platform(),
+                         'date': datetime.datetime.now().isoformat(timespec='seconds')},
+                'results': results,
+            }, f, indent=2)
+        print(f"Saved {save}")
+    shutil.rmtree(ctx.workdir, ignore_errors=True)
+    if baseline and compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
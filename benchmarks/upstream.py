@@ -0,0 +1,107 @@
+# Exercise the market-data gateway (rate limiter lanes, circuit breaker and the
+# quote cache's stale-while-revalidate) against a local FakeYahoo that injects
+# latency and errors. No network.
+#
+# python benchmarks/upstream.py [--latency 0.05] [--error-rate 0.2] [--rate 20]
+#                               [--flood 200]
+#
+# Reports how long a trade-lane quote takes while a flood of bar-lane requests
+# is queued, how quickly requests fail once the upstream is down and the circuit
+# opens, and how long a page-lane lookup takes when it can be served stale.
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_yahoo import FakeYahoo
+from marketdata import AsyncMarketData
+from quotes import QuoteCache
+
+
+def _timed(f):
+    started = time.perf_counter()
+    result = f()
+    return time.perf_counter() - started, result
+
+
+def lanes(fake, rate, flood):
+    # A burst of chart downloads, then trade quotes while the backlog drains
+    client = AsyncMarketData(chart_url=fake.chart_url, rate=rate, burst=rate)
+    done = {}
+
+    def download():
+        done['bars'] = _timed(lambda: client.fetch_prices([f"FLOOD{i}" for i in range(flood)], lane='bars'))
+
+    thread = threading.Thread(target=download)
+    thread.start()
+    time.sleep(0.2)
+    trades = [_timed(lambda: client.fetch_prices(['AAPL'], lane='trade'))[0] for _ in range(5)]
+    thread.join()
+    client.close()
+    seconds, prices = done['bars']
+    print(f"lanes: {flood} bar-lane requests took {seconds:.2f}s ({len(prices)} priced); "
+          f"trade quotes meanwhile median {statistics.median(trades) * 1e3:.0f} ms, max {max(trades) * 1e3:.0f} ms")
+
+
+def breaker(fake, rate):
+    client = AsyncMarketData(chart_url=fake.chart_url, rate=rate, burst=rate, retries=1, backoff=0.05,
+                             failure_threshold=5, cooldown=2.0)
+    error_rate = fake.error_rate
+    fake.error_rate = 1.0
+    before = fake.requests
+    seconds, _ = _timed(lambda: client.fetch_prices([f"DOWN{i}" for i in range(20)]))
+    print(f"breaker: upstream down, 20 lookups took {seconds * 1e3:.0f} ms and sent {fake.requests - before} "
+          f"requests; circuit {client.breaker.state}")
+    before = fake.requests
+    seconds, _ = _timed(lambda: client.fetch_prices([f"DOWN{i}" for i in range(20)]))
+    print(f"breaker: while open, 20 lookups took {seconds * 1e3:.1f} ms and sent {fake.requests - before} requests")
+    fake.error_rate = 0.0
+    time.sleep(client.breaker.cooldown)
+    prices = client.fetch_prices(['AAPL'])
+    print(f"breaker: after the cooldown the trial request {'succeeded' if prices else 'failed'}; "
+          f"circuit {client.breaker.state}")
+    fake.error_rate = error_rate
+    client.close()
+
+
+def stale(fake, rate):
+    client = AsyncMarketData(chart_url=fake.chart_url, rate=rate, burst=rate)
+    cache = QuoteCache(client.fetch_prices, ttl=0.5, stale_ttl=60)
+    symbols = [f"PAGE{i}" for i in range(20)]
+    cold, _ = _timed(lambda: cache.get_quotes(symbols))
+    time.sleep(0.6)
+    latency = fake.latency
+    fake.latency = 1.0
+    served, quotes = _timed(lambda: cache.get_quotes(symbols))
+    delayed = sum(not fresh for _, fresh in quotes.values())
+    blocking, _ = _timed(lambda: cache.get_prices(symbols[:1]))
+    print(f"stale: cold lookup {cold * 1e3:.0f} ms; with a 1s upstream, expired quotes served in "
+          f"{served * 1e3:.1f} ms ({delayed}/{len(symbols)} marked delayed) vs {blocking * 1e3:.0f} ms fresh-only")
+    fake.latency = latency
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Market data gateway under injected latency and errors.')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every fake response')
+    parser.add_argument('--error-rate', type=float, default=0.2, help='share of fake responses that are HTTP 503')
+    parser.add_argument('--rate', type=float, default=20, help='gateway requests per second')
+    parser.add_argument('--flood', type=int, default=200, help='bar-lane requests queued ahead of the trades')
+    args = parser.parse_args()
+    fake = FakeYahoo(latency=args.latency, error_rate=args.error_rate).start()
+    try:
+        lanes(fake, args.rate, args.flood)
+        breaker(fake, args.rate)
+        stale(fake, args.rate)
+    finally:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
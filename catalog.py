@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import threading
+import time
+
+MAX_GRAM = 3
+
+
+def _grams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class AssetCatalog:
+    # Immutable lookup structure over the asset universe, built once per load:
+    # symbol -> asset dict, lowercased fields, and an n-gram index (lengths 1-3)
+    # that narrows substring search to a few candidates before ranking them.
+    def __init__(self, assets):
+        self.assets = list(assets)
+        self.by_symbol = {a['symbol']: a for a in self.assets}
+        self._symbols = [a['symbol'].lower() for a in self.assets]
+        self._names = [a['name'].lower() for a in self.assets]
+        self._index = {}
+        for i, (symbol, name) in enumerate(zip(self._symbols, self._names)):
+            for text in (symbol, name):
+                for n in range(1, MAX_GRAM + 1):
+                    for gram in _grams(text, n):
+                        self._index.setdefault(gram, set()).add(i)
+
+    def __contains__(self, symbol):
+        return symbol in self.by_symbol
+
+    def __len__(self):
+        return len(self.assets)
+
+    def get(self, symbol):
+        return self.by_symbol.get(symbol)
+
+    def name(self, symbol):
+        asset = self.by_symbol.get(symbol)
+        return asset['name'] if asset else symbol
+
+    def _candidates(self, query):
+        if len(query) <= MAX_GRAM:
+            return self._index.get(query, set())
+        postings = sorted((self._index.get(gram, set()) for gram in _grams(query, MAX_GRAM)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+        return {i for i in candidates if query in self._symbols[i] or query in self._names[i]}
+
+    def _rank(self, i, query):
+        symbol = self._symbols[i]
+        name = self._names[i]
+        if symbol == query:
+            score = 0
+        elif symbol.startswith(query):
+            score = 1
+        elif name.startswith(query):
+            score = 2
+        elif any(word.startswith(query) for word in name.split()):
+            score = 3
+        else:
+            score = 4
+        return score, len(symbol), symbol
+
+    def search(self, query, offset=0, limit=20):
+        # Substring match on symbol or name, best matches first. Returns one page
+        # of assets and the total number of matches.
+        query = query.strip().lower()
+        if not query:
+            return self.assets[offset:offset + limit], len(self.assets)
+        ranked = sorted(self._candidates(query), key=lambda i: self._rank(i, query))
+        return [self.assets[i] for i in ranked[offset:offset + limit]], len(ranked)
+
+
+class LazyCatalog:
+    # Holds the current AssetCatalog. It is built on first use from an on-disk
+    # snapshot (never from the network), refreshed in a background thread when the
+    # snapshot is missing or older than max_age, and swapped in atomically.
+    # fetch returns a list of assets; fallback gives the assets to serve when no
+    # snapshot exists yet.
+    #
+    # At most every check_interval seconds, get() stats the snapshot and reloads
+    # it if another worker process rewrote it, and starts a refresh if it is
+    # stale; after a failed fetch the next attempt waits retry_after seconds.
+    def __init__(self, path, fetch, fallback, max_age, check_interval=5, retry_after=300):
+        self.path = path
+        self.fetch = fetch
+        self.fallback = fallback
+        self.max_age = max_age
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self._catalog = None
+        self._fetched_at = 0
+        self._mtime = None
+        self._checked_at = 0
+        self._retry_at = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if self._catalog is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._checked_at = now
+                if self._catalog is None or self._snapshot_mtime() != self._mtime:
+                    self._catalog = self._load_snapshot()
+            self.refresh_if_stale()
+        return self._catalog
+
+    def _snapshot_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load_snapshot(self):
+        self._mtime = self._snapshot_mtime()
+        if self._mtime is not None:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self._fetched_at = data['fetched_at']
+            return AssetCatalog(data['assets'])
+        return AssetCatalog(self.fallback())
+
+    def refresh_if_stale(self):
+        with self._lock:
+            now = time.time()
+            if self._refreshing or now - self._fetched_at < self.max_age or now < self._retry_at:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name='asset-refresh', daemon=True).start()
+
+    def refresh(self):
+        try:
+            assets = self.fetch()
+            if not assets:
+                raise ValueError("no assets fetched")
+            fetched_at = time.time()
+            tmp = f"{self.path}.{os.getpid()}.tmp"  # Workers may refresh concurrently
+            with open(tmp, 'w') as f:
+                json.dump({'fetched_at': fetched_at, 'assets': assets}, f)
+            os.replace(tmp, self.path)
+            catalog = AssetCatalog(assets)
+            with self._lock:
+                self._catalog = catalog
+                self._fetched_at = fetched_at
+                self._mtime = self._snapshot_mtime()
+        except Exception as e:
+            logging.getLogger(__name__).warning("Asset universe refresh failed: %s", e)
+            self._retry_at = time.time() + self.retry_after
+        finally:
+            with self._lock:
+                self._refreshing = False
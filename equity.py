@@ -0,0 +1,76 @@
+import datetime
+
+import numpy as np
+
+
+# Daily equity engine: finds each day's end in the Ledger by binary search,
+# replays only the days that have transactions, carries cash and positions forward
+# and values every day at once against a symbols x days close-price matrix. A
+# snapshot holds the finished days and the ledger position they end at, so later
+# calls only compute the days added since.
+
+def new_snapshot(user):
+    return {
+        'day': (user['start_date'].date() - datetime.timedelta(days=1)).isoformat(),
+        'tx_count': 0,
+        'days': [],
+        'values': [],
+    }
+
+
+def _day_end(day):
+    return datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(0, 0))
+
+
+def snapshot_is_valid(snapshot, ledger):
+    # Backdated transactions (e.g. catch_up auto-closes) invalidate finished days
+    return ledger.count_before(_day_end(datetime.date.fromisoformat(snapshot['day']))) == snapshot['tx_count']
+
+
+def advance(snapshot, ledger, end_day, closes_for):
+    # closes_for(symbol, days) returns the close at midnight of each day as an
+    # array, NaN where there is no bar.
+    first_day = datetime.date.fromisoformat(snapshot['day']) + datetime.timedelta(days=1)
+    if end_day < first_day:
+        return snapshot
+    days = [first_day + datetime.timedelta(days=n) for n in range((end_day - first_day).days + 1)]
+    i = snapshot['tx_count']
+    state = ledger.state(i)
+    ends = ledger.counts_before([_day_end(day) for day in days]).tolist()
+    symbols = sorted(set(state['long']) | set(state['short']) | ledger.symbols_between(i, ends[-1]))
+    index = {symbol: k for k, symbol in enumerate(symbols)}
+    n = len(days)
+    shape = (len(symbols), n)
+    long_amount, long_avg = np.zeros(shape), np.zeros(shape)
+    short_amount, short_avg = np.zeros(shape), np.zeros(shape)
+    balance = np.zeros(n)
+    changed = np.full(n, -1)
+    for d, j in enumerate(ends):
+        if d == 0 or j > i:
+            # Record the state only on days it changes; the rest is forward filled
+            ledger.apply(state, i, j)
+            i = j
+            changed[d] = d
+            balance[d] = state['balance']
+            for symbol, pos in state['long'].items():
+                long_amount[index[symbol], d] = pos['amount']
+                long_avg[index[symbol], d] = pos['avg_price']
+            for symbol, pos in state['short'].items():
+                short_amount[index[symbol], d] = pos['amount']
+                short_avg[index[symbol], d] = pos['avg_price']
+    fill = np.maximum.accumulate(changed)
+    values = balance[fill]
+    if symbols:
+        closes = np.vstack([closes_for(symbol, days) for symbol in symbols])
+        long_amount, long_avg = long_amount[:, fill], long_avg[:, fill]
+        short_amount, short_avg = short_amount[:, fill], short_avg[:, fill]
+        long_close = np.where(np.isnan(closes), long_avg, closes)
+        short_close = np.where(np.isnan(closes), short_avg, closes)
+        values = values + (long_amount * long_close).sum(axis=0)
+        values = values + (short_amount * (2 * short_avg - short_close)).sum(axis=0)
+    return {
+        'day': end_day.isoformat(),
+        'tx_count': i,
+        'days': snapshot['days'] + [day.isoformat() for day in days],
+        'values': snapshot['values'] + values.tolist(),
+    }
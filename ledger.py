@@ -0,0 +1,260 @@
+import copy
+import datetime
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+ACTIONS = ['buy', 'short', 'sell_cover', 'stop_loss', 'stop_profit']
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+BUY, SHORT = ACTION_CODES['buy'], ACTION_CODES['short']
+CHECKPOINT_EVERY = 256  # Transactions between position checkpoints
+EPOCH = datetime.datetime(1970, 1, 1)
+COLUMNS = [('t', np.int64), ('id', np.int64), ('symbol', np.int32), ('action', np.int8), ('amount', np.int64), ('price', np.float64),
+           ('commission', np.float64), ('stop_loss', np.float64), ('stop_profit', np.float64), ('cash', np.float64)]
+
+
+def to_micros(value):
+    # Naive ISO datetime (or datetime) -> integer microseconds since the epoch
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return (value.replace(tzinfo=None) - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def from_micros(t):
+    return EPOCH + datetime.timedelta(microseconds=int(t))
+
+
+def _nan_if_none(value):
+    return np.nan if value is None else value
+
+
+def _none_if_nan(value):
+    return None if np.isnan(value) else float(value)
+
+
+class Ledger:
+    # One user's transactions as typed columns sorted by time: timestamp (epoch
+    # microseconds), symbol id, action code, amount, price, commission (NaN when the
+    # trade predates commissions) and stop levels, plus the cash balance after each
+    # transaction. Positions are checkpointed every CHECKPOINT_EVERY transactions,
+    # so the state as of any time is a binary search plus a replay of at most
+    # CHECKPOINT_EVERY rows.
+    def __init__(self, initial_balance, commission_rate):
+        self.initial_balance = initial_balance
+        self.commission_rate = commission_rate
+        self.symbols = []
+        self._symbol_ids = {}
+        self._size = 0
+        self._columns = {name: np.empty(0, dtype) for name, dtype in COLUMNS}
+        self._checkpoints = [{'long': {}, 'short': {}}]
+        self.last_id = 0  # Highest storage row id seen, for incremental loads
+
+    def __len__(self):
+        return self._size
+
+    def column(self, name):
+        # Read-only view of the filled part of a column
+        return self._columns[name][:self._size]
+
+    def _symbol_id(self, symbol):
+        i = self._symbol_ids.get(symbol)
+        if i is None:
+            i = self._symbol_ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return i
+
+    def extended(self, rows):
+        # A copy of this ledger with rows appended, leaving this one untouched for
+        # concurrent readers. rows are (id, datetime, action, symbol, amount, price,
+        # commission, stop_loss, stop_profit) tuples in id order. Rows out of time
+        # order, within rows or against the stored ones (backdated auto-closes,
+        # unsorted legacy histories), are sorted in by (timestamp, id) and the
+        # aggregates recomputed from the first displaced row.
+        if not rows:
+            return self
+        new = copy.copy(self)
+        new.symbols = list(self.symbols)
+        new._symbol_ids = dict(self._symbol_ids)
+        new._columns = dict(self._columns)
+        new._checkpoints = list(self._checkpoints)
+        new._extend(rows)
+        return new
+
+    def _extend(self, rows):
+        # Appending only writes past the old size; the sorting path builds new arrays
+        n = len(rows)
+        start = self._size
+        end = start + n
+        self._reserve(end)
+        c = self._columns
+        c['t'][start:end] = [to_micros(row[1]) for row in rows]
+        c['id'][start:end] = [row[0] for row in rows]
+        c['action'][start:end] = [ACTION_CODES[row[2]] for row in rows]
+        c['symbol'][start:end] = [self._symbol_id(row[3]) for row in rows]
+        c['amount'][start:end] = [row[4] for row in rows]
+        c['price'][start:end] = [row[5] for row in rows]
+        for k, name in [(6, 'commission'), (7, 'stop_loss'), (8, 'stop_profit')]:
+            c[name][start:end] = [_nan_if_none(row[k]) for row in rows]
+        self._size = end
+        self.last_id = max(self.last_id, rows[-1][0])
+        if np.any(np.diff(c['t'][max(start - 1, 0):end]) < 0):
+            order = np.lexsort((c['id'][:end], c['t'][:end]))
+            for name, _ in COLUMNS:
+                c[name] = c[name][:end][order]
+            start = min(start, int(np.argmax(order != np.arange(end))))
+        self._recompute(start)
+
+    def _reserve(self, size):
+        capacity = len(self._columns['t'])
+        if size > capacity:
+            capacity = max(size, 2 * capacity, 64)
+            for name, dtype in COLUMNS:
+                column = np.empty(capacity, dtype)
+                column[:self._size] = self._columns[name][:self._size]
+                self._columns[name] = column
+
+    def _recompute(self, start):
+        # Rebuild cash and checkpoints for rows start.. from the checkpoint before it
+        k = start // CHECKPOINT_EVERY
+        del self._checkpoints[k + 1:]
+        i = k * CHECKPOINT_EVERY
+        state = self._state_from_checkpoint(k)
+        cash = self._columns['cash']
+        for row in self._rows(i, self._size):
+            self._apply(state, row)
+            cash[i] = state['balance']
+            i += 1
+            if i % CHECKPOINT_EVERY == 0:
+                self._checkpoints.append(copy.deepcopy({'long': state['long'], 'short': state['short']}))
+
+    def _state_from_checkpoint(self, k):
+        i = k * CHECKPOINT_EVERY
+        state = copy.deepcopy(self._checkpoints[k])
+        state['balance'] = float(self._columns['cash'][i - 1]) if i else self.initial_balance
+        return state
+
+    def _rows(self, start, stop):
+        c = self._columns
+        return zip(c['symbol'][start:stop].tolist(), c['action'][start:stop].tolist(),
+                   c['amount'][start:stop].tolist(), c['price'][start:stop].tolist(),
+                   c['commission'][start:stop].tolist())
+
+    def _apply(self, state, row):
+        symbol_id, act, am, pr, comm = row
+        symbol = self.symbols[symbol_id]
+        long = state['long']
+        short = state['short']
+        if comm != comm:  # NaN: old transactions predate commissions
+            comm = am * pr * self.commission_rate
+        if act == BUY or act == SHORT:
+            book = long if act == BUY else short
+            if symbol in book:
+                old_am = book[symbol]['amount']
+                old_pr = book[symbol]['avg_price']
+                new_am = old_am + am
+                book[symbol] = {'amount': new_am, 'avg_price': (old_am * old_pr + am * pr) / new_am}
+            else:
+                book[symbol] = {'amount': am, 'avg_price': pr}
+            state['balance'] -= am * pr + comm
+        else:
+            revenue = 0
+            if symbol in long:
+                revenue = am * pr
+                if am >= long[symbol]['amount']:
+                    long.pop(symbol)
+                else:
+                    long[symbol] = dict(long[symbol], amount=long[symbol]['amount'] - am)
+            elif symbol in short:
+                revenue = am * (2 * short[symbol]['avg_price'] - pr)
+                if am >= short[symbol]['amount']:
+                    short.pop(symbol)
+                else:
+                    short[symbol] = dict(short[symbol], amount=short[symbol]['amount'] - am)
+            state['balance'] += revenue - comm
+
+    def count_before(self, dt):
+        # Number of transactions strictly before dt
+        return int(np.searchsorted(self.column('t'), to_micros(dt), side='left'))
+
+    def counts_before(self, dts):
+        return np.searchsorted(self.column('t'), [to_micros(dt) for dt in dts], side='left')
+
+    def state(self, count):
+        # {'balance', 'long', 'short'} after the first count transactions
+        k = count // CHECKPOINT_EVERY
+        state = self._state_from_checkpoint(k)
+        for row in self._rows(k * CHECKPOINT_EVERY, count):
+            self._apply(state, row)
+        return state
+
+    def state_at(self, dt):
+        return self.state(self.count_before(dt))
+
+    def apply(self, state, start, stop):
+        # Replay transactions start..stop onto state in place
+        for row in self._rows(start, stop):
+            self._apply(state, row)
+
+    def symbols_between(self, start, stop):
+        return {self.symbols[i] for i in np.unique(self.column('symbol')[start:stop])}
+
+    def transaction(self, i):
+        # Row i as the transaction dict the rest of the app uses
+        c = self._columns
+        tx = {
+            'datetime': from_micros(c['t'][i]).isoformat(),
+            'action': ACTIONS[c['action'][i]],
+            'symbol': self.symbols[c['symbol'][i]],
+            'amount': int(c['amount'][i]),
+            'price': float(c['price'][i]),
+            'stop_loss': _none_if_nan(c['stop_loss'][i]),
+            'stop_profit': _none_if_nan(c['stop_profit'][i]),
+        }
+        if not np.isnan(c['commission'][i]):
+            tx['commission'] = float(c['commission'][i])
+        return tx
+
+    def page(self, before=None, limit=50):
+        # Newest-first transactions before the cursor, a (timestamp, storage id)
+        # pair or None for the newest. Rows are ordered by timestamp and then id
+        # (rows sharing a timestamp arrive in id order and the sort is stable), so
+        # the pair is unique even when a batch of fills shares one timestamp.
+        # Returns them with the cursor for the next page, None after the oldest.
+        if before is None:
+            stop = self._size
+        else:
+            t = self.column('t')
+            lo, hi = np.searchsorted(t, before[0], side='left'), np.searchsorted(t, before[0], side='right')
+            stop = int(lo + np.searchsorted(self.column('id')[lo:hi], before[1], side='left'))
+        start = max(stop - limit, 0)
+        txs = [self.transaction(i) for i in range(stop - 1, start - 1, -1)]
+        return txs, (int(self._columns['t'][start]), int(self._columns['id'][start])) if start else None
+
+
+class LedgerCache:
+    # Per-process LRU of Ledgers. Each get() pulls only the rows stored since the
+    # ledger was last seen (by any process), so steady-state cost is one indexed
+    # query returning nothing.
+    def __init__(self, load_rows, max_size=256):
+        self.load_rows = load_rows  # load_rows(username, after_id) -> rows in id order
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username, user):
+        key = (user['initial_balance'], user['commission_rate'])
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] != key:
+                entry = self._entries[username] = [key, Ledger(*key), threading.Lock()]
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        with entry[2]:
+            entry[1] = entry[1].extended(self.load_rows(username, entry[1].last_id))
+            return entry[1]
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
@@ -0,0 +1,71 @@
+import contextlib
+import fcntl
+import hashlib
+import os
+import threading
+
+
+class FileLock:
+    # Advisory flock on a file, shared by every process that opens the same path
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def acquire(self, blocking=True):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _UserLock:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.depth = 0
+
+
+class UserLocks:
+    # Serializes read-modify-write cycles on one user across threads (an RLock per
+    # user) and across worker processes (a lock file per user).
+    def __init__(self, root):
+        self.root = root
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @contextlib.contextmanager
+    def hold(self, username):
+        username = username.lower()
+        with self._lock:
+            local = self._locks.setdefault(username, _UserLock())
+        with local.lock:
+            # Re-entrant within a thread: only the outermost hold takes the file lock
+            depth = local.depth
+            local.depth = depth + 1
+            try:
+                if depth:
+                    yield
+                else:
+                    # Usernames are arbitrary text, so the file is named by a digest
+                    name = hashlib.sha1(username.encode()).hexdigest()
+                    with FileLock(os.path.join(self.root, f"{name}.lock")):
+                        yield
+            finally:
+                local.depth = depth
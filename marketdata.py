@@ -0,0 +1,263 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+import numpy as np
+
+from metrics import UPSTREAM_CIRCUIT, UPSTREAM_REQUESTS, UPSTREAM_SECONDS, UPSTREAM_SYMBOLS, UPSTREAM_WAIT_SECONDS
+
+YAHOO_CHART_URL = 'https://query1.finance.yahoo.com/v8/finance/chart/{symbol}'
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Priority (lower goes first) and the longest a request waits for a rate-limit
+# token, per lane: trade fills, stop checks, quotes for pages, bar downloads.
+LANES = {'trade': (0, 2.0), 'stops': (1, 10.0), 'quotes': (2, 3.0), 'bars': (3, 10.0)}
+
+
+class MarketDataError(Exception):
+    pass
+
+
+class Unavailable(MarketDataError):
+    # Not sent upstream: the circuit is open or no rate-limit token came in time
+    pass
+
+
+class TokenBucket:
+    # Rate limit for all upstream requests: `rate` tokens a second, up to `burst`
+    # banked. When tokens run out, waiters are served by priority and then in
+    # arrival order, so a backlog of chart downloads never delays a trade fill.
+    # Lives on the client's event loop and is not thread-safe.
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._stamp = clock()
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._timer = None
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    async def acquire(self, priority=0, timeout=None):
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._schedule()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise Unavailable(f"no upstream request slot within {timeout}s") from None
+
+    def _schedule(self):
+        if self._timer is None and self._waiters:
+            delay = max((1 - self._tokens) / self.rate, 0)
+            self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _dispatch(self):
+        self._timer = None
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():  # Timed-out waiters are skipped without a token
+                future.set_result(None)
+                self._tokens -= 1
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        self._schedule()
+
+
+class CircuitBreaker:
+    # Stops sending requests upstream after `threshold` consecutive failures
+    # (timeouts, connection errors, 429 and 5xx). While open, requests fail at
+    # once; after `cooldown` seconds a single trial request is let through, and
+    # its outcome closes the circuit or opens it for another cooldown.
+    def __init__(self, threshold=5, cooldown=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        UPSTREAM_CIRCUIT.set(0)
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if self._trial or not self.blocked() else 'open'
+
+    def blocked(self):
+        # True while requests would be refused; checked before queueing for a token
+        return self.opened_at is not None and (self._trial or self.clock() - self.opened_at < self.cooldown)
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        if self.blocked():
+            return False
+        self._trial = True
+        UPSTREAM_CIRCUIT.set(2)
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        UPSTREAM_CIRCUIT.set(0)
+
+    def failure(self):
+        self.failures += 1
+        if self._trial or self.failures >= self.threshold:
+            self.opened_at = self.clock()
+            self._trial = False
+            UPSTREAM_CIRCUIT.set(1)
+
+
+class AsyncMarketData:
+    # Asyncio client for the Yahoo chart API. One event loop thread owns a shared
+    # connection pool; lookups for many symbols run concurrently, bounded by a global
+    # and a per-host limit, with per-request timeouts and retries with backoff.
+    # fetch_prices and fetch_bars are blocking wrappers for Flask request threads and
+    # plug into QuoteCache and BarStore.
+    #
+    # Every attempt, retries included, first takes a token from one TokenBucket in
+    # its lane's priority (see LANES) and then passes the CircuitBreaker, so a
+    # throttling or stalled upstream gets a bounded request rate and, once it keeps
+    # failing, none at all until the cooldown's trial request succeeds.
+    def __init__(self, chart_url=YAHOO_CHART_URL, max_connections=32, per_host=16, timeout=5.0, retries=3,
+                 backoff=0.25, rate=20.0, burst=40, failure_threshold=5, cooldown=30.0):
+        self.chart_url = chart_url
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.rate = rate
+        self.burst = burst
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self._bucket = None
+        self._loop = None
+        self._session = None
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='market-data', daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def run(self, coro):
+        # Run a coroutine on the client's loop from any thread and wait for it
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        return future.result()
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            if self._session is not None:
+                asyncio.run_coroutine_threadsafe(self._session.close(), loop).result()
+                self._session = None
+            self._bucket = None
+            loop.call_soon_threadsafe(loop.stop)
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    async def _slot(self, lane):
+        if self.breaker.blocked():
+            raise Unavailable("upstream circuit open")
+        if self._bucket is None:
+            self._bucket = TokenBucket(self.rate, self.burst)
+        priority, max_wait = LANES[lane]
+        with UPSTREAM_WAIT_SECONDS.time(lane=lane):
+            await self._bucket.acquire(priority, max_wait)
+        if not self.breaker.allow():
+            raise Unavailable("upstream circuit open")
+
+    async def get_json(self, url, params=None, lane='quotes'):
+        if self._session is None:
+            from curl_cffi.requests import AsyncSession
+            self._session = AsyncSession(max_clients=self.max_connections, impersonate='chrome')
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random()))
+            await self._slot(lane)
+            try:
+                async with self._host_limit(url):
+                    resp = await self._session.get(url, params=params, timeout=self.timeout)
+            except Exception as e:
+                self.breaker.failure()
+                error = MarketDataError(f"{url}: {e}")
+                continue
+            if resp.status_code in RETRY_STATUS:
+                self.breaker.failure()
+                error = MarketDataError(f"{url}: HTTP {resp.status_code}")
+                continue
+            self.breaker.success()
+            if resp.status_code != 200:
+                raise MarketDataError(f"{url}: HTTP {resp.status_code}")
+            return resp.json()
+        raise error
+
+    async def chart(self, symbol, params, lane='quotes'):
+        kind = 'bars' if 'period1' in params else 'quote'
+        UPSTREAM_SYMBOLS.inc(symbol=symbol)
+        with UPSTREAM_SECONDS.time(kind=kind):
+            try:
+                data = await self.get_json(self.chart_url.format(symbol=quote(symbol, safe='')), params, lane)
+            except Unavailable:
+                UPSTREAM_REQUESTS.inc(kind=kind, outcome='unavailable')
+                raise
+            except Exception:
+                UPSTREAM_REQUESTS.inc(kind=kind, outcome='error')
+                raise
+        UPSTREAM_REQUESTS.inc(kind=kind, outcome='ok')
+        result = (data.get('chart') or {}).get('result')
+        if not result:
+            raise MarketDataError(f"{symbol}: no chart data")
+        return result[0]
+
+    async def quote(self, symbol, lane='quotes'):
+        meta = (await self.chart(symbol, {'range': '1d', 'interval': '1d'}, lane))['meta']
+        return meta.get('regularMarketPrice', 0.0)
+
+    async def quotes(self, symbols, lane='quotes'):
+        # Symbols that failed, or came back without a positive price, are left out
+        symbols = list(symbols)
+        results = await asyncio.gather(*[self.quote(symbol, lane) for symbol in symbols], return_exceptions=True)
+        return {symbol: price for symbol, price in zip(symbols, results)
+                if not isinstance(price, Exception) and price and price > 0}
+
+    async def bars(self, symbol, start, end, interval, lane='bars'):
+        result = await self.chart(symbol, {'period1': int(start), 'period2': int(end), 'interval': interval}, lane)
+        times = result.get('timestamp') or []
+        closes = result.get('indicators', {}).get('quote', [{}])[0].get('close') or []
+        t = np.array(times, dtype=np.int64)
+        close = np.array([np.nan if c is None else c for c in closes], dtype=np.float64)
+        keep = (t >= start) & (t < end)
+        return t[keep], close[keep]
+
+    def fetch_prices(self, symbols, lane='quotes'):
+        return self.run(self.quotes(symbols, lane))
+
+    def fetch_bars(self, symbol, start, end, interval, lane='bars'):
+        return self.run(self.bars(symbol, start, end, interval, lane))
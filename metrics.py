@@ -0,0 +1,150 @@
+import contextlib
+import functools
+import threading
+import time
+
+# Default buckets (seconds) for latency histograms, from 1ms to 10s
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    # Renders every registered metric in the Prometheus text exposition format.
+    # Values live in this process only; under several worker processes each one
+    # reports its own.
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.label_names)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in values.items()]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(buckets) + (float('inf'),)
+        super().__init__(name, help, labels, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, **labels):
+        # Decorator form of time()
+        def decorate(f):
+            @functools.wraps(f)
+            def wrap(*args, **kwargs):
+                with self.time(**labels):
+                    return f(*args, **kwargs)
+            return wrap
+        return decorate
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        lines = []
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+
+# Shared by the modules below the app; app-level metrics are defined in app.py
+UPSTREAM_SECONDS = Histogram('upstream_request_seconds', 'Market data fetch latency, including retries', ['kind'])
+UPSTREAM_REQUESTS = Counter('upstream_requests_total', 'Market data fetches by outcome', ['kind', 'outcome'])
+UPSTREAM_SYMBOLS = Counter('upstream_symbol_requests_total', 'Market data fetches per symbol', ['symbol'])
+UPSTREAM_WAIT_SECONDS = Histogram('upstream_rate_limit_wait_seconds', 'Time waiting for a rate-limit token', ['lane'])
+UPSTREAM_CIRCUIT = Gauge('upstream_circuit_state', 'Market data circuit breaker (0 closed, 1 open, 2 half-open)')
+QUOTE_CACHE = Counter('quote_cache_lookups_total',
+                      'Quote lookups by result (hit, miss, coalesced, shared, stale)', ['result'])
+PROFILE_CACHE = Counter('profile_cache_lookups_total', 'User profile lookups by result (hit, miss)', ['result'])
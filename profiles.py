@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+from metrics import PROFILE_CACHE
+
+
+def _copy(profile):
+    # Callers modify what they get (trades, auto-closes), never the cached profile
+    portfolio = {typ: {symbol: dict(pos) for symbol, pos in positions.items()}
+                 for typ, positions in profile['portfolio'].items()}
+    return dict(profile, portfolio=portfolio, transactions=[])
+
+
+class ProfileCache:
+    # Per-process LRU of compact user profiles: balances, commission rate, start
+    # date and open positions, with no password and no transactions (the Ledger
+    # holds those). While a cached profile is current, get() costs one primary-key
+    # lookup of the user's version, however long the account has been trading.
+    # put() after a save writes the new profile through; a save in another process
+    # bumps the version, so the next get() here reloads.
+    def __init__(self, load, version, max_size=4096):
+        self.load = load  # load(username) -> profile with its 'version', or None
+        self.version = version  # version(username) -> the stored version, or None
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        version = self.version(username)
+        if version is None:
+            self.invalidate(username)
+            return None
+        with self._lock:
+            profile = self._entries.get(username)
+            if profile is not None and profile['version'] == version:
+                self._entries.move_to_end(username)
+                PROFILE_CACHE.inc(result='hit')
+                return _copy(profile)
+        PROFILE_CACHE.inc(result='miss')
+        profile = self.load(username)
+        if profile is not None:
+            self.put(username, profile)
+        return profile
+
+    def put(self, username, profile):
+        profile = _copy(profile)
+        profile.pop('password', None)
+        with self._lock:
+            cached = self._entries.get(username)
+            if cached is None or cached['version'] <= profile['version']:
+                self._entries[username] = profile
+                self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import QUOTE_CACHE
+
+
+class _Pending:
+    def __init__(self):
+        self.event = threading.Event()
+        self.prices = {}  # {symbol: (price, monotonic time it was fetched)}
+        self.error = None
+
+
+class QuoteCache:
+    # Process-wide quote cache: TTL per entry, LRU eviction, one batched provider call
+    # for all missing symbols and coalescing of concurrent fetches for the same symbol.
+    # The provider is any callable taking a list of symbols and a lane keyword (see
+    # marketdata.LANES) and returning {symbol: price}. An optional shared store
+    # (get_quotes/put_quotes) lets several worker processes reuse each other's
+    # fetches before going to the provider; their quotes keep the age they had
+    # there. Entries are kept for stale_ttl seconds for get_quotes to serve while
+    # they are refetched.
+    def __init__(self, provider, ttl=30, max_size=4096, shared=None, stale_ttl=0):
+        self.provider = provider
+        self.shared = shared
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def set_provider(self, provider):
+        with self._lock:
+            self.provider = provider
+            self._entries.clear()
+
+    def invalidate(self, symbols=None):
+        with self._lock:
+            if symbols is None:
+                self._entries.clear()
+            else:
+                for symbol in symbols:
+                    self._entries.pop(symbol, None)
+
+    def get_price(self, symbol, max_age=None, lane='quotes'):
+        return self.get_prices([symbol], max_age=max_age, lane=lane).get(symbol)
+
+    def get_prices(self, symbols, max_age=None, lane='quotes'):
+        # {symbol: price} for symbols with a quote no older than the TTL (or
+        # max_age); symbols the provider could not price are left out
+        quotes = self._lookup(symbols, max_age, lane, stale=False)
+        return {symbol: price for symbol, (price, _) in quotes.items()}
+
+    def get_quotes(self, symbols, max_age=None, lane='quotes'):
+        # {symbol: (price, fresh)}. Past its TTL but within stale_ttl, an entry is
+        # returned at once with fresh=False and refetched in the background, so
+        # pages keep rendering while the provider is slow or down.
+        return self._lookup(symbols, max_age, lane, stale=True)
+
+    def _lookup(self, symbols, max_age, lane, stale):
+        ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        result = {}
+        waiting = []
+        missing = []
+        revalidate = []
+        pending = None
+        with self._lock:
+            now = time.monotonic()
+            for symbol in dict.fromkeys(symbols):
+                entry = self._entries.get(symbol)
+                age = None if entry is None else now - entry[1]
+                if age is not None and age < ttl:
+                    self._entries.move_to_end(symbol)
+                    result[symbol] = (entry[0], True)
+                elif stale and age is not None and age < self.stale_ttl:
+                    result[symbol] = (entry[0], False)
+                    if symbol not in self._inflight:
+                        revalidate.append(symbol)
+                elif symbol in self._inflight:
+                    waiting.append((symbol, self._inflight[symbol]))
+                else:
+                    missing.append(symbol)
+            QUOTE_CACHE.inc(len(result) - len(revalidate), result='hit')
+            QUOTE_CACHE.inc(len(revalidate), result='stale')
+            QUOTE_CACHE.inc(len(waiting), result='coalesced')
+            QUOTE_CACHE.inc(len(missing), result='miss')
+            provider = self.provider
+            if missing:
+                pending = self._start(missing)
+            if revalidate:
+                background = self._start(revalidate)
+        if revalidate:
+            threading.Thread(target=self._complete, args=(background, provider, revalidate, ttl, lane),
+                             name='quote-revalidate', daemon=True).start()
+        if pending is not None:
+            self._complete(pending, provider, missing, ttl, lane)
+            if pending.error is not None:
+                raise pending.error
+            for symbol in missing:
+                if symbol in pending.prices:
+                    result[symbol] = (pending.prices[symbol][0], True)
+        retry = []
+        for symbol, other in waiting:
+            other.event.wait()
+            if other.error is not None:
+                raise other.error
+            if symbol in other.prices:
+                price, stamp = other.prices[symbol]
+                if time.monotonic() - stamp < ttl:
+                    result[symbol] = (price, True)
+                else:  # A lookup with a looser TTL read an older shared quote than this one accepts
+                    retry.append(symbol)
+        if retry:
+            with self._lock:
+                pending = self._start(retry)
+                provider = self.provider
+            self._complete(pending, provider, retry, ttl, lane)
+            if pending.error is not None:
+                raise pending.error
+            for symbol in retry:
+                if symbol in pending.prices:
+                    result[symbol] = (pending.prices[symbol][0], True)
+        return result
+
+    def _start(self, symbols):
+        # Called with the lock held: later lookups of symbols wait for this fetch
+        pending = _Pending()
+        for symbol in symbols:
+            self._inflight[symbol] = pending
+        return pending
+
+    def _complete(self, pending, provider, symbols, ttl, lane):
+        try:
+            pending.prices = self._fetch(provider, symbols, ttl, lane)
+        except Exception as e:
+            pending.error = e
+        finally:
+            with self._lock:
+                for symbol in symbols:
+                    if self._inflight.get(symbol) is pending:
+                        del self._inflight[symbol]
+                    if symbol in pending.prices:
+                        self._store(symbol, *pending.prices[symbol])
+            pending.event.set()
+
+    def _fetch(self, provider, symbols, ttl, lane):
+        # {symbol: (price, monotonic fetch time)}
+        prices = {}
+        rest = symbols
+        if self.shared is not None:
+            shared = self.shared.get_quotes(symbols, ttl)
+            QUOTE_CACHE.inc(len(shared), result='shared')
+            offset = time.monotonic() - time.time()
+            prices = {symbol: (price, fetched_at + offset) for symbol, (price, fetched_at) in shared.items()}
+            rest = [symbol for symbol in symbols if symbol not in prices]
+        if rest:
+            fetched = provider(rest, lane=lane) or {}
+            if fetched and self.shared is not None:
+                self.shared.put_quotes(fetched)
+            now = time.monotonic()
+            prices.update((symbol, (price, now)) for symbol, price in fetched.items())
+        return prices
+
+    def _store(self, symbol, price, stamp):
+        entry = self._entries.get(symbol)
+        if entry is not None and entry[1] > stamp:
+            return  # Keep the newer quote
+        self._entries[symbol] = (price, stamp)
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
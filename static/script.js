@@ -1,7 +1,7 @@
 // static/script.js
 function updateChart(period) {
     currentPeriod = period;
-    fetch(`/api/history/${symbol}/${period}`)
+    fetch(`/api/history/${symbol}/${period}?format=compact&max_points=400`)
         .then(response => response.json())
         .then(data => {
             const ctx = document.getElementById('chart').getContext('2d');
@@ -9,10 +9,10 @@ function updateChart(period) {
             chart = new Chart(ctx, {
                 type: 'line',
                 data: {
-                    labels: data.dates,
+                    labels: data.t.map(t => t * 1000),
                     datasets: [{
                         label: 'Price',
-                        data: data.prices,
+                        data: data.c,
                         borderColor: 'blue',
                         fill: false
                     }]
@@ -24,4 +24,20 @@ function updateChart(period) {
                 }
             });
         });
-}
\ No newline at end of file
+}
+
+// Calls onTick({symbol, price}) for live prices: over /stream/prices, or by
+// polling /api/prices every intervalMs when the server refuses the stream
+function watchPrices(symbols, onTick, intervalMs) {
+    const query = `symbols=${symbols.map(encodeURIComponent).join(',')}`;
+    const source = new EventSource(`/stream/prices?${query}`);
+    source.onmessage = event => onTick(JSON.parse(event.data));
+    source.onerror = () => {
+        if (source.readyState !== EventSource.CLOSED) return;  // Reconnecting by itself
+        const poll = () => fetch(`/api/prices?${query}`)
+            .then(response => response.ok ? response.json() : {})
+            .then(prices => Object.entries(prices).forEach(([symbol, price]) => onTick({symbol, price})));
+        poll();
+        setInterval(poll, intervalMs);
+    };
+}
@@ -0,0 +1,149 @@
+import bisect
+import threading
+
+
+class _Side:
+    # Trigger prices kept sorted, with the owning username at the same index
+    def __init__(self):
+        self.keys = []
+        self.users = []
+
+    def add(self, trigger, username):
+        i = bisect.bisect_right(self.keys, trigger)
+        self.keys.insert(i, trigger)
+        self.users.insert(i, username)
+
+    def remove(self, trigger, username):
+        i = bisect.bisect_left(self.keys, trigger)
+        while i < len(self.keys) and self.keys[i] == trigger:
+            if self.users[i] == username:
+                del self.keys[i]
+                del self.users[i]
+                return
+            i += 1
+
+    def at_or_above(self, price):
+        return self.users[bisect.bisect_left(self.keys, price):]
+
+    def at_or_below(self, price):
+        return self.users[:bisect.bisect_right(self.keys, price)]
+
+    def nearest(self, price):
+        i = bisect.bisect_left(self.keys, price)
+        return min(abs(self.keys[j] - price) for j in (i - 1, i) if 0 <= j < len(self.keys))
+
+
+class StopBook:
+    # In-memory index of every stop_loss/stop_profit level, by symbol and then by
+    # (position type, stop kind), so a sweep only touches orders a price has crossed.
+    def __init__(self):
+        self._books = {}
+        self._orders = {}
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.version = None  # Storage positions version the book reflects, if tracked
+
+    def ensure_loaded(self, users):
+        # users is a callable returning (username, user) pairs, only called once
+        with self._lock:
+            if not self.loaded:
+                for username, user in users():
+                    self._sync(username, user)
+                self.loaded = True
+
+    def reload(self, users, version=None):
+        # Resync every user from a fresh (username, user) listing, e.g. after other
+        # processes changed positions
+        with self._lock:
+            users = dict(users())
+            for username in list(self._orders):
+                if username not in users:
+                    self._sync(username, {'portfolio': {'long': {}, 'short': {}}})
+            for username, user in users.items():
+                self._sync(username, user)
+            self.loaded = True
+            self.version = version
+
+    def update(self, users, version):
+        # Resync only the (username, user) pairs given, e.g. those saved since
+        # self.version
+        with self._lock:
+            for username, user in users:
+                self._sync(username, user)
+            self.version = version
+
+    def sync_user(self, username, user):
+        with self._lock:
+            if self.loaded:
+                self._sync(username, user)
+
+    def _sync(self, username, user):
+        current = {}
+        for typ in ['long', 'short']:
+            for symbol, pos in user['portfolio'][typ].items():
+                stops = (pos.get('stop_loss'), pos.get('stop_profit'))
+                if stops != (None, None):
+                    current[(typ, symbol)] = stops
+        previous = self._orders.get(username, {})
+        for key, stops in previous.items():
+            if current.get(key) != stops:
+                self._remove(username, key, stops)
+        for key, stops in current.items():
+            if previous.get(key) != stops:
+                self._add(username, key, stops)
+        if current:
+            self._orders[username] = current
+        else:
+            self._orders.pop(username, None)
+
+    def _add(self, username, key, stops):
+        typ, symbol = key
+        book = self._books.setdefault(symbol, {})
+        for kind, trigger in zip(['stop_loss', 'stop_profit'], stops):
+            if trigger is not None:
+                book.setdefault((typ, kind), _Side()).add(trigger, username)
+
+    def _remove(self, username, key, stops):
+        typ, symbol = key
+        book = self._books.get(symbol, {})
+        for kind, trigger in zip(['stop_loss', 'stop_profit'], stops):
+            if trigger is not None and (typ, kind) in book:
+                book[(typ, kind)].remove(trigger, username)
+                if not book[(typ, kind)].keys:
+                    del book[(typ, kind)]
+        if not book:
+            self._books.pop(symbol, None)
+
+    def symbols(self):
+        with self._lock:
+            return list(self._books)
+
+    def size(self):
+        with self._lock:
+            return sum(len(orders) for orders in self._orders.values())
+
+    def distance(self, symbol, price):
+        # Relative distance from price to the closest trigger level on symbol
+        with self._lock:
+            sides = self._books.get(symbol, {}).values()
+            if not sides or price <= 0:
+                return None
+            return min(side.nearest(price) for side in sides) / price
+
+    def triggered(self, symbol, price):
+        # Same semantics as is_triggered: stop_loss wins when both levels are crossed
+        with self._lock:
+            book = self._books.get(symbol, {})
+            hits = {}
+            queries = [
+                ('long', 'stop_loss', _Side.at_or_above),
+                ('short', 'stop_loss', _Side.at_or_below),
+                ('long', 'stop_profit', _Side.at_or_below),
+                ('short', 'stop_profit', _Side.at_or_above),
+            ]
+            for typ, kind, query in queries:
+                side = book.get((typ, kind))
+                if side is not None:
+                    for username in query(side, price):
+                        hits.setdefault((username, typ), kind)
+            return [(username, typ, kind) for (username, typ), kind in hits.items()]
@@ -0,0 +1,315 @@
+import contextlib
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    initial_balance REAL NOT NULL,
+    current_balance REAL NOT NULL,
+    commission_rate REAL NOT NULL,
+    start_date TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    positions_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS positions (
+    username TEXT NOT NULL,
+    typ TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    avg_price REAL NOT NULL,
+    stop_loss REAL,
+    stop_profit REAL,
+    PRIMARY KEY (username, typ, symbol)
+);
+CREATE INDEX IF NOT EXISTS positions_symbol ON positions (symbol);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    datetime TEXT NOT NULL,
+    action TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    price REAL NOT NULL,
+    commission REAL,
+    stop_loss REAL,
+    stop_profit REAL
+);
+CREATE INDEX IF NOT EXISTS transactions_user_datetime ON transactions (username, datetime);
+CREATE INDEX IF NOT EXISTS transactions_symbol ON transactions (symbol);
+CREATE INDEX IF NOT EXISTS transactions_user_id ON transactions (username, id);
+CREATE TABLE IF NOT EXISTS quotes (
+    symbol TEXT PRIMARY KEY,
+    price REAL NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS equity_marks (
+    username TEXT NOT NULL,
+    day TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (username, day)
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    username TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+TX_FIELDS = ['datetime', 'action', 'symbol', 'amount', 'price', 'commission', 'stop_loss', 'stop_profit']
+
+
+class Storage:
+    # SQLite (WAL mode) backend for user accounts. Users, open positions and an
+    # append-only transactions table are stored separately, so a trade writes one
+    # user row, that user's few positions and only the new transactions. Each save
+    # bumps the user's version, which lets caches check they are current cheaply.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+        for column in ['version', 'positions_version']:
+            if column not in columns:
+                conn.execute(f'ALTER TABLE users ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS users_positions_version ON users (positions_version)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def user_exists(self, username):
+        row = self._conn().execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone()
+        return row is not None
+
+    def load_user(self, username):
+        # The account without its password or stored transactions (see
+        # transaction_rows). 'transactions' starts empty and collects the trades
+        # made before the next save_user, which appends them.
+        conn = self._conn()
+        conn.execute('BEGIN')  # One read snapshot for the user row and positions
+        try:
+            row = conn.execute('SELECT initial_balance, current_balance, commission_rate, start_date, version '
+                               'FROM users WHERE username = ?', (username,)).fetchone()
+            portfolio = self._load_portfolio(conn, username) if row is not None else None
+        finally:
+            conn.execute('COMMIT')
+        if row is None:
+            return None
+        return {
+            'initial_balance': row[0],
+            'current_balance': row[1],
+            'commission_rate': row[2],
+            'start_date': datetime.datetime.fromisoformat(row[3]),
+            'version': row[4],
+            'portfolio': portfolio,
+            'transactions': [],
+        }
+
+    def user_version(self, username):
+        row = self._conn().execute('SELECT version FROM users WHERE username = ?', (username,)).fetchone()
+        return row[0] if row else None
+
+    def password_hash(self, username):
+        row = self._conn().execute('SELECT password FROM users WHERE username = ?', (username,)).fetchone()
+        return row[0] if row else None
+
+    def transaction_rows(self, username, after_id=0):
+        # Raw (id, *TX_FIELDS) rows stored after after_id, for building a Ledger
+        return self._conn().execute(
+            'SELECT id, ' + ', '.join(TX_FIELDS) + ' FROM transactions WHERE username = ? AND id > ? ORDER BY id',
+            (username, after_id)).fetchall()
+
+    def _load_portfolio(self, conn, username):
+        portfolio = {'long': {}, 'short': {}}
+        for typ, symbol, amount, avg_price, stop_loss, stop_profit in conn.execute(
+                'SELECT typ, symbol, amount, avg_price, stop_loss, stop_profit FROM positions WHERE username = ?',
+                (username,)):
+            portfolio[typ][symbol] = {'amount': amount, 'avg_price': avg_price, 'stop_loss': stop_loss,
+                                      'stop_profit': stop_profit}
+        return portfolio
+
+    def iter_portfolios(self):
+        # Every user's open positions from one query, without touching transactions
+        portfolios = {}
+        for username, typ, symbol, amount, avg_price, stop_loss, stop_profit in self._conn().execute(
+                'SELECT username, typ, symbol, amount, avg_price, stop_loss, stop_profit FROM positions'):
+            portfolio = portfolios.setdefault(username, {'portfolio': {'long': {}, 'short': {}}})['portfolio']
+            portfolio[typ][symbol] = {'amount': amount, 'avg_price': avg_price, 'stop_loss': stop_loss,
+                                      'stop_profit': stop_profit}
+        return list(portfolios.items())
+
+    def positions_version(self):
+        # Grows whenever any user's positions are saved, in any process; other
+        # writes (quotes, marks, snapshots) leave it alone
+        return self._conn().execute('SELECT COALESCE(MAX(positions_version), 0) FROM users').fetchone()[0]
+
+    def portfolios_since(self, version):
+        # iter_portfolios for the users saved after positions_version version,
+        # including those left with no positions
+        conn = self._conn()
+        usernames = [row[0] for row in conn.execute('SELECT username FROM users WHERE positions_version > ?',
+                                                    (version,))]
+        portfolios = {username: {'portfolio': {'long': {}, 'short': {}}} for username in usernames}
+        for username, typ, symbol, amount, avg_price, stop_loss, stop_profit in conn.execute(
+                'SELECT username, typ, symbol, amount, avg_price, stop_loss, stop_profit FROM positions '
+                'WHERE username IN (SELECT username FROM users WHERE positions_version > ?)', (version,)):
+            if username in portfolios:
+                portfolios[username]['portfolio'][typ][symbol] = {
+                    'amount': amount, 'avg_price': avg_price, 'stop_loss': stop_loss, 'stop_profit': stop_profit}
+        return list(portfolios.items())
+
+    def accounts(self):
+        # (username, initial_balance, current_balance) for every user
+        return self._conn().execute('SELECT username, initial_balance, current_balance FROM users').fetchall()
+
+    def position_rows(self):
+        return self._conn().execute('SELECT username, typ, symbol, amount, avg_price FROM positions').fetchall()
+
+    def ledger_version(self):
+        # Changes whenever any account is created or trades, in any process
+        return self._conn().execute('SELECT (SELECT MAX(id) FROM transactions), (SELECT COUNT(*) FROM users)').fetchone()
+
+    def mark_summary(self, before_day, usernames=None):
+        # {username: (highest mark, last mark before before_day)}, for every
+        # account with marks or, given usernames, for just those accounts
+        conn = self._conn()
+        where, params = '', []
+        if usernames is not None:
+            usernames = list(usernames)
+            if not usernames:
+                return {}
+            where, params = f"WHERE username IN ({', '.join('?' * len(usernames))})", usernames
+        peaks = dict(conn.execute(f'SELECT username, MAX(value) FROM equity_marks {where} GROUP BY username', params))
+        previous = dict(conn.execute(
+            f'SELECT username, value FROM equity_marks m {where} {"AND" if where else "WHERE"} day = '
+            '(SELECT MAX(day) FROM equity_marks WHERE username = m.username AND day < ?)', params + [before_day]))
+        return {username: (peak, previous.get(username)) for username, peak in peaks.items()}
+
+    def put_marks(self, day, values):
+        # Latest value of each account for day, one row per account per day
+        with self.transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO equity_marks VALUES (?, ?, ?)',
+                             [(username, day, value) for username, value in values.items()])
+
+    def save_user(self, username, data):
+        # Writes the balance and positions, appends data['transactions'] (the
+        # trades since load_user) and empties that list. With a 'password' the
+        # account is created if new. Returns the user's new version.
+        with self.transaction() as conn:
+            version = self._write_user(conn, username, data)
+        data['transactions'] = []
+        return version
+
+    def _write_user(self, conn, username, data):
+        # save_user's writes, inside the caller's transaction
+        start_date = data['start_date']
+        if isinstance(start_date, datetime.datetime):
+            start_date = start_date.isoformat()
+        if 'password' in data:
+            conn.execute('INSERT INTO users (username, password, initial_balance, current_balance, '
+                         'commission_rate, start_date) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(username) DO UPDATE '
+                         'SET password = excluded.password, current_balance = excluded.current_balance, '
+                         'commission_rate = excluded.commission_rate',
+                         (username, data['password'], data['initial_balance'], data['current_balance'],
+                          data['commission_rate'], start_date))
+        else:
+            conn.execute('UPDATE users SET current_balance = ?, commission_rate = ? WHERE username = ?',
+                         (data['current_balance'], data['commission_rate'], username))
+        # Writes are serialized by BEGIN IMMEDIATE, so MAX + 1 is a unique, growing stamp
+        conn.execute('UPDATE users SET version = version + 1, positions_version = '
+                     '(SELECT COALESCE(MAX(positions_version), 0) + 1 FROM users) WHERE username = ?', (username,))
+        version = conn.execute('SELECT version FROM users WHERE username = ?', (username,)).fetchone()[0]
+        conn.execute('DELETE FROM positions WHERE username = ?', (username,))
+        conn.executemany('INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?, ?)', [
+            (username, typ, symbol, pos['amount'], pos['avg_price'], pos.get('stop_loss'), pos.get('stop_profit'))
+            for typ in ['long', 'short'] for symbol, pos in data['portfolio'][typ].items()])
+        conn.executemany('INSERT INTO transactions (username, ' + ', '.join(TX_FIELDS) + ') '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', [
+                             (username,) + tuple(tx.get(field) for field in TX_FIELDS)
+                             for tx in data['transactions']])
+        return version
+
+    def load_snapshot(self, username):
+        row = self._conn().execute('SELECT data FROM snapshots WHERE username = ?', (username,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_snapshot(self, username, snapshot):
+        self._conn().execute('INSERT OR REPLACE INTO snapshots VALUES (?, ?)', (username, json.dumps(snapshot)))
+
+    def get_quotes(self, symbols, max_age):
+        # {symbol: (price, fetched_at)} for quotes any worker process fetched
+        # within the last max_age seconds
+        symbols = list(symbols)
+        if not symbols:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT symbol, price, fetched_at FROM quotes WHERE fetched_at >= ? "
+            f"AND symbol IN ({', '.join('?' * len(symbols))})",
+            [time.time() - max_age] + symbols)
+        return {symbol: (price, fetched_at) for symbol, price, fetched_at in rows}
+
+    def put_quotes(self, prices):
+        now = time.time()
+        with self.transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO quotes VALUES (?, ?, ?)',
+                             [(symbol, price, now) for symbol, price in prices.items()])
+
+    def migrate_json(self, json_dir):
+        # One-shot import of the old data/users/*.json files. Imported files are
+        # renamed to *.json.migrated so they are never read again. Worker processes
+        # starting together should hold a shared FileLock around this.
+        if not os.path.isdir(json_dir):
+            return 0
+        count = 0
+        for f in sorted(os.listdir(json_dir)):
+            if not f.endswith('.json'):
+                continue
+            path = os.path.join(json_dir, f)
+            username = f[:-5]
+            try:
+                with open(path, 'r') as fh:
+                    data = json.load(fh)
+            except FileNotFoundError:
+                continue  # Already migrated and renamed by another process
+            data.setdefault('portfolio', {'long': {}, 'short': {}})
+            data.setdefault('transactions', [])
+            data.setdefault('commission_rate', 0.00005)  # Default for old users
+            # The exists check and the import commit together, so a user is never imported twice
+            with self.transaction() as conn:
+                if conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone() is None:
+                    self._write_user(conn, username, data)
+                    count += 1
+            try:
+                os.replace(path, path + '.migrated')
+            except FileNotFoundError:
+                pass
+        return count
+
+
+if __name__ == '__main__':
+    import sys
+    json_dir = sys.argv[1] if len(sys.argv) > 1 else 'data/users'
+    db_path = sys.argv[2] if len(sys.argv) > 2 else 'data/app.db'
+    print(f"Migrated {Storage(db_path).migrate_json(json_dir)} users into {db_path}")
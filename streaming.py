@@ -0,0 +1,95 @@
+import logging
+import queue
+import threading
+import time
+
+
+class Subscription:
+    def __init__(self, symbols):
+        self.symbols = set(symbols)
+        self.queue = queue.Queue(maxsize=1000)
+
+    def push(self, symbol, price):
+        try:
+            self.queue.put_nowait((symbol, price))
+        except queue.Full:
+            pass  # A stalled client drops ticks rather than blocking the poller
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class PriceHub:
+    # A single background poller for the union of all subscribed symbols. Each tick
+    # makes one bulk fetch and pushes only prices that changed to every subscriber
+    # watching that symbol, however many clients there are.
+    def __init__(self, fetch_prices, interval=5.0):
+        self.fetch_prices = fetch_prices
+        self.interval = interval
+        self._subscribers = {}
+        self._last = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def subscribe(self, symbols):
+        sub = Subscription(symbols)
+        with self._lock:
+            for symbol in sub.symbols:
+                self._subscribers.setdefault(symbol, set()).add(sub)
+                if symbol in self._last:
+                    sub.push(symbol, self._last[symbol])
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='price-hub', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for symbol in sub.symbols:
+                subs = self._subscribers.get(symbol)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subscribers[symbol]
+                        self._last.pop(symbol, None)
+
+    def symbols(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def add_listener(self, listener):
+        # listener(symbol, price) is called for every polled price, changed or not
+        self._listeners.append(listener)
+
+    def publish(self, prices):
+        for listener in self._listeners:
+            for symbol, price in prices.items():
+                listener(symbol, price)
+        with self._lock:
+            for symbol, price in prices.items():
+                if symbol in self._subscribers and self._last.get(symbol) != price:
+                    self._last[symbol] = price
+                    for sub in self._subscribers[symbol]:
+                        sub.push(symbol, price)
+
+    def poll(self):
+        symbols = self.symbols()
+        if symbols:
+            self.publish(self.fetch_prices(symbols))
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                # Upstream hiccups must not kill the poller; the next tick retries
+                logging.getLogger(__name__).warning("Price poll failed: %s", e)
+            self._wakeup.wait(max(self.interval - (time.monotonic() - started), 0))
+            self._wakeup.clear()
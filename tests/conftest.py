@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_yahoo import FakeYahoo
+
+
+@pytest.fixture
+def fake_yahoo():
+    # A local stand-in for the Yahoo chart API; tests may change its latency and
+    # error_rate while it runs
+    fake = FakeYahoo().start()
+    yield fake
+    fake.stop()
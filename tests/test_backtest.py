@@ -0,0 +1,33 @@
+import numpy as np
+
+from backtest import run
+
+
+TIMES = np.arange(4, dtype=np.int64) * 86400
+CLOSES = np.array([[10.0, 11.0, 12.0, 13.0]])
+
+
+def orders_once(*orders):
+    def strategy(ctx):
+        return list(orders) if ctx.t == 0 else []
+    return strategy
+
+
+def test_invalid_orders_are_rejected():
+    result = run(orders_once({'action': 'buy', 'symbol': 'MISSING', 'amount': 1},
+                             {'action': 'buy', 'symbol': 'AAPL', 'amount': -10},
+                             {'action': 'buy', 'symbol': 'AAPL', 'amount': 1.5},
+                             {'action': 'hold', 'symbol': 'AAPL', 'amount': 1},
+                             {'action': 'buy', 'symbol': 'AAPL', 'amount': 10}),
+                 TIMES, CLOSES, ['AAPL'], 1000, commission_rate=0)
+    assert [reason for _, _, reason in result['rejected']] == [
+        "Invalid asset.", "Invalid amount.", "Invalid amount.", "Action must be one of buy, short, sell_cover."]
+    assert result['user']['current_balance'] == 900
+    assert result['user']['portfolio']['long']['AAPL']['amount'] == 10
+
+
+def test_integer_balance_keeps_fractional_equity():
+    result = run(orders_once({'action': 'buy', 'symbol': 'AAPL', 'amount': 1}), TIMES, CLOSES, ['AAPL'], 10000,
+                 commission_rate=0.005)
+    assert result['equity'].dtype == np.float64
+    assert result['equity'][0] == 10000 - 0.05
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+import pytest
+
+from marketdata import LANES, AsyncMarketData, CircuitBreaker, TokenBucket, Unavailable
+from quotes import QuoteCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_serves_trades_before_queued_bars():
+    async def run():
+        bucket = TokenBucket(rate=50, burst=1)
+        await bucket.acquire()  # Spend the banked token so everything below queues
+        served = []
+
+        async def request(lane):
+            await bucket.acquire(LANES[lane][0])
+            served.append(lane)
+
+        bars = [asyncio.ensure_future(request('bars')) for _ in range(5)]
+        await asyncio.sleep(0)
+        await asyncio.gather(request('trade'), request('stops'), *bars)
+        return served
+
+    assert asyncio.run(run()) == ['trade', 'stops'] + ['bars'] * 5
+
+
+def test_token_bucket_times_out():
+    async def run():
+        bucket = TokenBucket(rate=1, burst=1)
+        await bucket.acquire()
+        with pytest.raises(Unavailable):
+            await bucket.acquire(timeout=0.05)
+
+    asyncio.run(run())
+
+
+def test_circuit_breaker_transitions():
+    clock = Clock()
+    breaker = CircuitBreaker(threshold=3, cooldown=10, clock=clock)
+    for _ in range(2):
+        breaker.failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    clock.now = 10
+    assert breaker.state == 'half_open'
+    assert breaker.allow()  # The trial request
+    assert breaker.blocked() and not breaker.allow()
+    breaker.failure()  # A failed trial opens it for another cooldown
+    assert breaker.state == 'open'
+
+    clock.now = 15
+    assert not breaker.allow()
+    clock.now = 20
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+
+
+def test_client_stops_calling_a_failing_upstream(fake_yahoo):
+    client = AsyncMarketData(chart_url=fake_yahoo.chart_url, retries=1, backoff=0.01,
+                             failure_threshold=3, cooldown=0.3)
+    try:
+        fake_yahoo.error_rate = 1.0
+        assert client.fetch_prices(['AAPL', 'MSFT']) == {}
+        assert client.breaker.state == 'open'
+        sent = fake_yahoo.requests
+        assert client.fetch_prices(['AAPL', 'MSFT']) == {}
+        assert fake_yahoo.requests == sent
+
+        fake_yahoo.error_rate = 0.0
+        time.sleep(0.3)
+        assert set(client.fetch_prices(['AAPL'])) == {'AAPL'}
+        assert client.breaker.state == 'closed'
+    finally:
+        client.close()
+
+
+def test_get_quotes_serves_stale_while_revalidating(fake_yahoo):
+    client = AsyncMarketData(chart_url=fake_yahoo.chart_url)
+    cache = QuoteCache(client.fetch_prices, ttl=0.1, stale_ttl=60)
+    try:
+        first = cache.get_quotes(['AAPL', 'MSFT'])
+        assert all(fresh for _, fresh in first.values())
+        time.sleep(0.15)
+
+        fake_yahoo.latency = 0.5
+        started = time.monotonic()
+        quotes = cache.get_quotes(['AAPL', 'MSFT'])
+        assert time.monotonic() - started < 0.25
+        assert quotes == {symbol: (price, False) for symbol, (price, _) in first.items()}
+        assert cache.get_prices(['AAPL'], max_age=0.1) != {}  # Waits for the refetch
+
+        deadline = time.monotonic() + 5
+        while not all(fresh for _, fresh in cache.get_quotes(['AAPL', 'MSFT']).values()):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    finally:
+        client.close()
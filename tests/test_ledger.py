@@ -0,0 +1,38 @@
+import datetime
+
+from ledger import Ledger
+
+
+def row(i, day, action, amount, price):
+    return (i, datetime.datetime(2024, *day), action, 'AAPL', amount, price, 0.0, None, None)
+
+
+def test_unsorted_first_load_is_sorted():
+    # A legacy history listed 03-01, 02-01, 02-10
+    ledger = Ledger(100000, 0).extended([
+        row(1, (3, 1), 'sell_cover', 10, 30.0),
+        row(2, (2, 1), 'buy', 10, 10.0),
+        row(3, (2, 10), 'buy', 10, 20.0),
+    ])
+    txs, cursor = ledger.page()
+    assert [tx['datetime'][:10] for tx in txs] == ['2024-03-01', '2024-02-10', '2024-02-01']
+    assert cursor is None
+    assert ledger.count_before(datetime.datetime(2024, 2, 5)) == 1
+    assert ledger.state_at(datetime.datetime(2024, 2, 5))['balance'] == 99900
+    state = ledger.state(len(ledger))
+    assert state['balance'] == 99700 + 300
+    assert state['long']['AAPL']['amount'] == 10
+
+
+def test_unsorted_appended_batch_is_sorted():
+    ledger = Ledger(100000, 0).extended([row(1, (1, 1), 'buy', 1, 100.0), row(2, (5, 1), 'buy', 1, 100.0)])
+    # Sorted after the stored rows at its start, out of order within
+    ledger = ledger.extended([row(3, (6, 1), 'buy', 1, 100.0), row(4, (3, 1), 'buy', 1, 50.0),
+                              row(5, (7, 1), 'buy', 1, 100.0)])
+    assert [int(i) for i in ledger.column('id')] == [1, 4, 2, 3, 5]
+    assert ledger.count_before(datetime.datetime(2024, 4, 1)) == 2
+    assert ledger.column('cash').tolist() == [99900, 99850, 99750, 99650, 99550]
+    txs, cursor = ledger.page(limit=3)
+    assert [tx['datetime'][:10] for tx in txs] == ['2024-07-01', '2024-06-01', '2024-05-01']
+    txs, cursor = ledger.page(cursor, limit=3)
+    assert [tx['datetime'][:10] for tx in txs] == ['2024-03-01', '2024-01-01'] and cursor is None
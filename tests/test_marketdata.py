@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+import pytest
+
+from fake_yahoo import price_at
+from marketdata import AsyncMarketData, MarketDataError
+
+
+@pytest.fixture
+def client(fake_yahoo):
+    client = AsyncMarketData(chart_url=fake_yahoo.chart_url, rate=100, burst=100, backoff=0.01)
+    yield client
+    client.close()
+
+
+def test_fetch_prices(fake_yahoo, client):
+    now = time.time()
+    prices = client.fetch_prices(['AAPL', 'MSFT', 'GC=F'])
+    assert set(prices) == {'AAPL', 'MSFT', 'GC=F'}
+    for symbol, price in prices.items():
+        assert price == pytest.approx(price_at(symbol, now), rel=1e-3)
+    assert fake_yahoo.requests == 3
+
+
+def test_fetch_bars(client):
+    end = int(time.time()) // 86400 * 86400
+    start = end - 10 * 86400
+    t, close = client.fetch_bars('AAPL', start, end, '1d')
+    assert len(t) == 9
+    assert np.all((t >= start) & (t < end))
+    assert close.tolist() == [price_at('AAPL', int(x)) for x in t]
+
+
+def test_retries_server_errors(fake_yahoo, client):
+    fake_yahoo.error_rate = 0.5
+    prices = client.fetch_prices([f"S{i}" for i in range(20)])
+    assert len(prices) == 20
+    assert fake_yahoo.requests > 20
+    assert client.breaker.state == 'closed'
+
+
+def test_gives_up_after_retries(fake_yahoo):
+    fake_yahoo.error_rate = 1.0
+    client = AsyncMarketData(chart_url=fake_yahoo.chart_url, retries=2, backoff=0.01, failure_threshold=100)
+    try:
+        assert client.fetch_prices(['AAPL']) == {}
+        assert fake_yahoo.requests == 3
+        with pytest.raises(MarketDataError):
+            client.fetch_bars('AAPL', time.time() - 86400 * 5, time.time(), '1d')
+    finally:
+        client.close()
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from quotes import QuoteCache
+
+
+class SharedStore:
+    # Stand-in for Storage's quotes table: {symbol: (price, fetched_at)}
+    def __init__(self, quotes):
+        self.quotes = dict(quotes)
+
+    def get_quotes(self, symbols, max_age):
+        return {s: self.quotes[s] for s in symbols if s in self.quotes and self.quotes[s][1] >= time.time() - max_age}
+
+    def put_quotes(self, prices):
+        self.quotes.update((s, (p, time.time())) for s, p in prices.items())
+
+
+class Provider:
+    def __init__(self, price=101.0, delay=0.0):
+        self.price = price
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, symbols, lane=None):
+        self.calls.append((list(symbols), lane))
+        time.sleep(self.delay)
+        return {s: self.price for s in symbols}
+
+
+def test_shared_quote_keeps_its_age():
+    provider = Provider()
+    cache = QuoteCache(provider, ttl=30, shared=SharedStore({'AAPL': (100.0, time.time() - 25)}))
+    assert cache.get_quotes(['AAPL']) == {'AAPL': (100.0, True)}
+    assert provider.calls == []
+    assert cache.get_price('AAPL', max_age=5, lane='trade') == 101.0
+    assert provider.calls == [(['AAPL'], 'trade')]
+    assert cache.get_price('AAPL', max_age=5) == 101.0
+    assert len(provider.calls) == 1
+
+
+def test_waiting_lookup_checks_its_own_max_age():
+    # A page lookup's fetch reads a 25s-old shared quote while a trade lookup waits on it
+    shared = SharedStore({'AAPL': (100.0, time.time() - 25)})
+    provider = Provider()
+    cache = QuoteCache(provider, ttl=30, shared=shared)
+    started = threading.Event()
+    get_quotes = shared.get_quotes
+
+    def slow_get_quotes(symbols, max_age):
+        started.set()
+        time.sleep(0.1)
+        return get_quotes(symbols, max_age)
+
+    shared.get_quotes = slow_get_quotes
+    page = threading.Thread(target=cache.get_quotes, args=(['AAPL'],))
+    page.start()
+    started.wait()
+    assert cache.get_price('AAPL', max_age=5, lane='trade') == 101.0
+    page.join()
+    assert provider.calls == [(['AAPL'], 'trade')]
@@ -0,0 +1,157 @@
+import numbers
+
+import numpy as np
+
+# Fill and stop logic shared by the trade routes, the batch order API, the stop
+# sweeps and backtests. Everything here works on a user dict in memory; callers
+# own loading, locking and saving.
+
+OPEN_ACTIONS = {'buy': 'long', 'short': 'short'}
+ORDER_ACTIONS = ['buy', 'short', 'sell_cover']
+
+
+class OrderError(Exception):
+    pass
+
+
+def open_position(user, action, symbol, amount, price, stop_loss, stop_profit, dt):
+    # buy (long) or short: pay amount * price plus commission from the balance
+    typ = OPEN_ACTIONS[action]
+    cost = amount * price
+    commission = cost * user['commission_rate']
+    total_cost = cost + commission
+    if user['current_balance'] < total_cost:
+        raise OrderError("Insufficient balance.")
+    user['current_balance'] -= total_cost
+    book = user['portfolio'][typ]
+    if symbol in book:
+        pos = book[symbol]
+        old_am = pos['amount']
+        old_pr = pos['avg_price']
+        new_am = old_am + amount
+        pos['avg_price'] = (old_am * old_pr + amount * price) / new_am
+        pos['amount'] = new_am
+    else:
+        book[symbol] = {'amount': amount, 'avg_price': price}
+    book[symbol]['stop_loss'] = stop_loss
+    book[symbol]['stop_profit'] = stop_profit
+    tx = {'datetime': dt.isoformat(), 'action': action, 'symbol': symbol, 'amount': amount, 'price': price,
+          'commission': commission, 'stop_loss': stop_loss, 'stop_profit': stop_profit}
+    user['transactions'].append(tx)
+    return tx
+
+
+def close_position(user, symbol, amount, price, dt):
+    # sell_cover: reduce the long position in symbol, or else the short one
+    commission = amount * price * user['commission_rate']
+    if symbol in user['portfolio']['long']:
+        typ = 'long'
+    elif symbol in user['portfolio']['short']:
+        typ = 'short'
+    else:
+        raise OrderError("No position to sell/cover.")
+    pos = user['portfolio'][typ][symbol]
+    if pos['amount'] < amount:
+        raise OrderError("Insufficient amount in portfolio.")
+    if typ == 'long':
+        revenue = amount * price
+    else:
+        revenue = amount * (2 * pos['avg_price'] - price)
+    pos['amount'] -= amount
+    if pos['amount'] == 0:
+        del user['portfolio'][typ][symbol]
+    user['current_balance'] += revenue - commission
+    tx = {'datetime': dt.isoformat(), 'action': 'sell_cover', 'symbol': symbol, 'amount': amount, 'price': price,
+          'commission': commission, 'stop_loss': None, 'stop_profit': None}
+    user['transactions'].append(tx)
+    return tx
+
+
+def parse_order(raw, user, tradable):
+    # One order in the /api/orders format -> the dict execute takes, or OrderError.
+    # tradable holds the symbols that may be opened; held ones may also be closed.
+    if not isinstance(raw, dict):
+        raise OrderError("Order must be an object.")
+    action = raw.get('action')
+    if action not in ORDER_ACTIONS:
+        raise OrderError(f"Action must be one of {', '.join(ORDER_ACTIONS)}.")
+    symbol = raw.get('symbol')
+    held = symbol in user['portfolio']['long'] or symbol in user['portfolio']['short']
+    if not isinstance(symbol, str) or not (symbol in tradable or (action == 'sell_cover' and held)):
+        raise OrderError("Invalid asset.")
+    amount = raw.get('amount')
+    if not isinstance(amount, numbers.Integral) or isinstance(amount, bool) or amount < 1:
+        raise OrderError("Invalid amount.")
+    stops = []
+    for key in ['stop_loss', 'stop_profit']:
+        value = raw.get(key)
+        if value is not None and (action == 'sell_cover' or not isinstance(value, numbers.Real)
+                                  or isinstance(value, bool)):
+            raise OrderError("Invalid stop levels.")
+        stops.append(None if value is None else float(value))
+    return {'action': action, 'symbol': symbol, 'amount': int(amount), 'stop_loss': stops[0],
+            'stop_profit': stops[1]}
+
+
+def execute(user, order, price, dt):
+    # order is {'action', 'symbol', 'amount', 'stop_loss', 'stop_profit'}
+    if order['action'] == 'sell_cover':
+        return close_position(user, order['symbol'], order['amount'], price, dt)
+    return open_position(user, order['action'], order['symbol'], order['amount'], price, order.get('stop_loss'),
+                         order.get('stop_profit'), dt)
+
+
+def is_triggered(typ, price, pos):
+    stop_loss = pos.get('stop_loss')
+    stop_profit = pos.get('stop_profit')
+    if typ == 'long':
+        if stop_loss is not None and price <= stop_loss:
+            return True, 'stop_loss'
+        if stop_profit is not None and price >= stop_profit:
+            return True, 'stop_profit'
+    elif typ == 'short':
+        if stop_loss is not None and price >= stop_loss:
+            return True, 'stop_loss'
+        if stop_profit is not None and price <= stop_profit:
+            return True, 'stop_profit'
+    return False, None
+
+
+def first_trigger(typ, prices, pos):
+    # Vectorized is_triggered over a price path: index and action of the first hit
+    stop_loss = pos.get('stop_loss')
+    stop_profit = pos.get('stop_profit')
+    loss = np.zeros(len(prices), bool)
+    profit = np.zeros(len(prices), bool)
+    with np.errstate(invalid='ignore'):
+        if typ == 'long':
+            if stop_loss is not None:
+                loss = prices <= stop_loss
+            if stop_profit is not None:
+                profit = prices >= stop_profit
+        else:
+            if stop_loss is not None:
+                loss = prices >= stop_loss
+            if stop_profit is not None:
+                profit = prices <= stop_profit
+    hit = loss | profit
+    if not hit.any():
+        return None, None
+    i = int(np.argmax(hit))
+    return i, 'stop_loss' if loss[i] else 'stop_profit'
+
+
+def apply_auto_close(user, typ, symbol, price, action_type, dt):
+    pos = user['portfolio'][typ][symbol]
+    amount = pos['amount']
+    commission_rate = user['commission_rate']
+    commission = amount * price * commission_rate
+    if typ == 'long':
+        user['current_balance'] += amount * price - commission
+    else:
+        user['current_balance'] += amount * (2 * pos['avg_price'] - price) - commission
+    del user['portfolio'][typ][symbol]
+    tx = {'datetime': dt.isoformat(), 'action': action_type, 'symbol': symbol, 'amount': amount, 'price': price,
+          'commission': commission, 'stop_loss': pos.get('stop_loss'), 'stop_profit': pos.get('stop_profit')}
+    user['transactions'].append(tx)
+    return tx
@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+
+
+class TriggerEngine:
+    # Event-driven stop evaluation. Only symbols with active stops are polled, each
+    # on its own schedule: every min_interval seconds when the price is within
+    # `near` (relative) of a trigger level, backing off linearly to max_interval at
+    # `far` and beyond. Each tick runs a StopBook range query for that symbol alone
+    # and fills triggered orders at the tick price through close(). refresh, if
+    # given, is called before each poll to resync the book.
+    def __init__(self, stop_book, close, fetch_prices, min_interval=5.0, max_interval=300.0, near=0.005, far=0.1,
+                 clock=time.monotonic, refresh=None):
+        self.stop_book = stop_book
+        self.refresh = refresh
+        self.close = close
+        self.fetch_prices = fetch_prices
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.near = near
+        self.far = far
+        self.clock = clock
+        self._due = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def interval_for(self, symbol, price):
+        distance = self.stop_book.distance(symbol, price)
+        if distance is None or distance >= self.far:
+            return self.max_interval
+        if distance <= self.near:
+            return self.min_interval
+        share = (distance - self.near) / (self.far - self.near)
+        return self.min_interval + share * (self.max_interval - self.min_interval)
+
+    def on_tick(self, symbol, price):
+        fills = self.stop_book.triggered(symbol, price)
+        for username, typ, action_type in fills:
+            self.close(username, typ, symbol, price, action_type)
+        with self._lock:
+            self._due[symbol] = self.clock() + self.interval_for(symbol, price)
+        return fills
+
+    def due_symbols(self, now):
+        symbols = self.stop_book.symbols()
+        watched = set(symbols)
+        with self._lock:
+            for symbol in list(self._due):
+                if symbol not in watched:
+                    del self._due[symbol]
+            return [symbol for symbol in symbols if self._due.get(symbol, now) <= now]
+
+    def poll(self):
+        if self.refresh is not None:
+            self.refresh()
+        due = self.due_symbols(self.clock())
+        if due:
+            prices = self.fetch_prices(due)
+            for symbol in due:
+                if symbol in prices:
+                    self.on_tick(symbol, prices[symbol])
+        with self._lock:
+            return min(self._due.values(), default=self.clock() + self.min_interval)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='trigger-engine', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                next_due = self.poll()
+            except Exception as e:
+                logging.getLogger(__name__).warning("Trigger poll failed: %s", e)
+                next_due = self.clock() + self.min_interval
+            # Wake at least every min_interval so newly placed stops are picked up quickly
+            time.sleep(min(max(next_due - self.clock(), 0.1), self.min_interval))
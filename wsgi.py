@@ -0,0 +1,7 @@
+# Production entry point for a multi-process server, e.g.
+#   gunicorn -w 4 --threads 8 wsgi:app
+# Do not use --preload: each worker must import the app itself so that exactly
+# one of them wins the scheduler lock.
+from app import app, start_background
+
+start_background()